@@ -0,0 +1,265 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from decode_metrics import DecodeMetrics
+from dialogue import iter_scenes_dialogue_paths
+from dialogue_writers import WRITERS
+from disk_reader import (SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, SectorNotFoundError, read_scenes,
+                         read_tracks_for_side)
+from g64 import G64
+from rapidlok_track_reader import RapidlokTrackReader
+from sampling_profiler import DEFAULT_INTERVAL, SUMMARY_SUFFIX, SamplingProfiler
+from scene_location import SCENE_LOCATIONS
+
+SIDE1_MARKER = "side1"
+SIDE2_MARKER = "side2"
+OUTPUT_EXTENSIONS = {"text": ".txt", "jsonl": ".jsonl", "csv": ".csv"}
+SUMMARY_FILENAME = "summary.json"
+
+
+class ImagePair:
+    def __init__(self, name, side1_path, side2_path):
+        self.name = name
+        self.side1_path = side1_path
+        # None when no side2 image was found, the pair is then reported as failed
+        self.side2_path = side2_path
+
+    def __repr__(self):
+        return self.name + ": " + self.side1_path + " + " + str(self.side2_path)
+
+
+def find_image_pairs(directory) -> list[ImagePair]:
+    """Every *side1*.g64 under directory with its *side2*.g64 partner, named after its path.
+
+    Names and markers are matched ignoring case. A side1 image without a partner is still
+    returned, with no side2_path.
+    """
+    pairs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        files_by_lower_name = {filename.lower(): filename for filename in files}
+        for filename in sorted(files):
+            lower_name = filename.lower()
+            if not lower_name.endswith(".g64") or SIDE1_MARKER not in lower_name:
+                continue
+            marker_pos = lower_name.index(SIDE1_MARKER)
+            partner = files_by_lower_name.get(
+                lower_name[:marker_pos] + SIDE2_MARKER + lower_name[marker_pos + len(SIDE1_MARKER):])
+            stem = (filename[:marker_pos] + filename[marker_pos + len(SIDE1_MARKER):-4]).strip("-_ .")
+            relative_dir = os.path.relpath(root, directory)
+            name_parts = [part for part in (relative_dir, stem) if part and part != "."]
+            name = "_".join(name_parts).replace(os.sep, "_") or "image"
+            pairs.append(ImagePair(name, os.path.join(root, filename),
+                                   os.path.join(root, partner) if partner else None))
+    return make_names_unique(pairs)
+
+
+def make_names_unique(pairs) -> list[ImagePair]:
+    # Pairs are written to files named after them: later pairs with a name already taken get a number
+    used_names = set()
+    for pair in pairs:
+        name = pair.name
+        number = 2
+        while name.lower() in used_names:
+            name = "%s_%d" % (pair.name, number)
+            number += 1
+        pair.name = name
+        used_names.add(name.lower())
+    return pairs
+
+
+def read_manifest(filename) -> list[ImagePair]:
+    """Read a manifest of name,side1_path,side2_path rows. Relative paths are relative to the manifest."""
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    pairs = []
+    with open(filename, newline="") as file:
+        for row in csv.reader(file):
+            if not row or row[0].startswith("#"):
+                continue
+            if len(row) != 3:
+                raise Exception("Manifest rows must be name,side1_path,side2_path: %s" % ",".join(row))
+            name, side1_path, side2_path = (value.strip() for value in row)
+            pairs.append(ImagePair(name, os.path.join(base_dir, side1_path), os.path.join(base_dir, side2_path)))
+    return make_names_unique(pairs)
+
+
+def get_missing_sectors(side_number, side_tracks) -> list[tuple[int, int, int]]:
+    missing = []
+    for track_num, track in side_tracks.items():
+        for sector in range(RapidlokTrackReader.compute_total_sectors(track_num) + 1):
+            if sector not in track:
+                missing.append((side_number, track_num, sector))
+    return missing
+
+
+def decode_image_pair(pair: ImagePair, output_dir, output_format) -> dict:
+    """Decode one pair of images and write its dialogue dump. Never raises: failures end up in the summary."""
+    summary = {"name": pair.name, "side1": pair.side1_path, "side2": pair.side2_path, "status": "ok",
+               "sectors_decoded": 0, "missing_sectors": [], "scenes": 0, "paths": 0, "stage_times": {}}
+    stage_times = summary["stage_times"]
+    stage_start = time.perf_counter()
+
+    def end_stage(stage):
+        nonlocal stage_start
+        now = time.perf_counter()
+        stage_times[stage] = round(now - stage_start, 6)
+        stage_start = now
+
+    metrics = DecodeMetrics()
+    if pair.side2_path is None:
+        summary["status"] = "error"
+        summary["error"] = "No side2 image found for " + pair.side1_path
+        summary["total_time"] = 0
+        summary["metrics"] = metrics.to_dict()
+        return summary
+    try:
+        with G64(pair.side1_path, use_mmap=True, metrics=metrics) as side_1, \
+                G64(pair.side2_path, use_mmap=True, metrics=metrics) as side_2:
+            end_stage("open")
+            side_1_tracks = read_tracks_for_side(side_1, SIDE1_EXCLUDED_TRACKS, metrics=metrics)
+            side_2_tracks = read_tracks_for_side(side_2, SIDE2_EXCLUDED_TRACKS, metrics=metrics)
+            end_stage("tracks")
+
+            for side_tracks in (side_1_tracks, side_2_tracks):
+                summary["sectors_decoded"] += sum(len(track) for track in side_tracks.values())
+            summary["missing_sectors"] = get_missing_sectors(1, side_1_tracks) + get_missing_sectors(2, side_2_tracks)
+
+            scenes_data = read_scenes(SCENE_LOCATIONS, side_1_tracks, side_2_tracks, metrics)
+            summary["scenes"] = len(scenes_data)
+            end_stage("scenes")
+
+        output_path = os.path.join(output_dir, pair.name + OUTPUT_EXTENSIONS[output_format])
+        with open(output_path, "w", newline="") as output:
+            writer = WRITERS[output_format](output)
+            for path in iter_scenes_dialogue_paths(scenes_data):
+                writer.write(path)
+                summary["paths"] += 1
+            writer.flush()
+        summary["output"] = output_path
+        end_stage("dialogue")
+    except SectorNotFoundError as e:
+        summary["status"] = "error"
+        summary["error"] = "%s: track %d sector %d could not be read, scene %s needs it" % (
+            pair.side1_path if e.side_number == 1 else pair.side2_path, e.track_num, e.sector, e.scene_id)
+        summary["traceback"] = traceback.format_exc()
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+        summary["traceback"] = traceback.format_exc()
+
+    summary["total_time"] = round(sum(stage_times.values()), 6)
+    summary["metrics"] = metrics.to_dict()
+    return summary
+
+
+def profile_image_pair(pair: ImagePair, output_dir, output_format, interval) -> tuple[dict, dict]:
+    # Runs in the worker, only the sampled stacks go back
+    with SamplingProfiler(interval) as profiler:
+        summary = decode_image_pair(pair, output_dir, output_format)
+    return summary, dict(profiler.stacks)
+
+
+def run_batch(pairs, output_dir, output_format="text", workers=0, progress=None,
+              profiler: SamplingProfiler = None) -> list[dict]:
+    """Decode every pair, at most `workers` at a time (0 or 1 runs serially).
+
+    Only workers * 2 pairs are in flight at once, so memory stays bounded however large the corpus is.
+    With a profiler, each pair is profiled where it is decoded and the stacks are merged into it.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summaries = []
+    if profiler:
+        task, task_args = profile_image_pair, (output_dir, output_format, profiler.interval)
+    else:
+        task, task_args = decode_image_pair, (output_dir, output_format)
+
+    def add_result(result):
+        if profiler:
+            result, stacks = result
+            profiler.merge(stacks)
+        summaries.append(result)
+        if progress:
+            progress(result)
+
+    if workers <= 1:
+        for pair in pairs:
+            add_result(task(pair, *task_args))
+        return summaries
+
+    pending_pairs = iter(pairs)
+    in_flight = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < workers * 2:
+                pair = next(pending_pairs, None)
+                if pair is None:
+                    break
+                in_flight.add(executor.submit(task, pair, *task_args))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                add_result(future.result())
+
+    order = {pair.name: i for i, pair in enumerate(pairs)}
+    summaries.sort(key=lambda s: order.get(s["name"], 0))
+    return summaries
+
+
+def build_totals(summaries) -> dict:
+    # Sector counts are over the images decoded successfully, a failed one may have stopped half way
+    decoded = [s for s in summaries if s["status"] == "ok"]
+    totals = {"images": len(summaries),
+              "failed": len(summaries) - len(decoded),
+              "sectors_decoded": sum(s["sectors_decoded"] for s in decoded),
+              "missing_sectors": sum(len(s["missing_sectors"]) for s in decoded),
+              "stage_times": {}}
+    for s in summaries:
+        for stage, seconds in s["stage_times"].items():
+            totals["stage_times"][stage] = round(totals["stage_times"].get(stage, 0) + seconds, 6)
+    return totals
+
+
+def print_progress(summary):
+    if summary["status"] == "ok":
+        print(f"{summary['name']}: {summary['sectors_decoded']} sectors, "
+              f"{len(summary['missing_sectors'])} missing, {summary['total_time']:.3f}s")
+    else:
+        print(f"{summary['name']}: FAILED - {summary['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dump the dialogue of many Law of the West disk image pairs")
+    parser.add_argument("source",
+                        help="a directory searched for *side1*.g64/*side2*.g64 pairs, or a name,side1,side2 manifest")
+    parser.add_argument("--output-dir", default="batch-output", help="where per-image dumps and the summary go")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="text", help="format of the per-image dumps")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="image pairs decoded at the same time (0 decodes serially)")
+    parser.add_argument("--profile",
+                        help="profile every decode and write the merged collapsed stacks to this file, "
+                             "with a summary by module in the same file name plus " + SUMMARY_SUFFIX)
+    parser.add_argument("--profile-interval", type=float, default=DEFAULT_INTERVAL * 1000,
+                        help="milliseconds between profiler samples")
+    args = parser.parse_args()
+
+    batch_profiler = SamplingProfiler(args.profile_interval / 1000) if args.profile else None
+    image_pairs = find_image_pairs(args.source) if os.path.isdir(args.source) else read_manifest(args.source)
+    batch_summaries = run_batch(image_pairs, args.output_dir, args.format, args.workers, print_progress,
+                                batch_profiler)
+    if batch_profiler:
+        batch_profiler.save(args.profile)
+
+    totals = build_totals(batch_summaries)
+    with open(os.path.join(args.output_dir, SUMMARY_FILENAME), "w") as summary_file:
+        json.dump({"totals": totals, "images": batch_summaries}, summary_file, indent=1)
+
+    print(f"{totals['images']} images, {totals['failed']} failed, {totals['sectors_decoded']} sectors decoded, "
+          f"{totals['missing_sectors']} missing in the images decoded")
+    sys.exit(1 if totals["failed"] else 0)
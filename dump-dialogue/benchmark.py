@@ -0,0 +1,186 @@
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import timeit
+
+from dialogue import TEXT_AREA_OFFSET, TOTAL_LINES, iter_scenes_dialogue_paths
+from dialogue_writers import TextPathWriter
+from disk_reader import SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, read_scenes_for_sides, read_scenes_on_demand
+from g64 import G64
+from g64_writer import pack_track
+from outcome_analytics import OutcomeAnalytics
+from gcr_decoder import GCRDecoder
+from gcr_encoder import GCREncoder
+from gcr_track_reader import GCRTrackReader
+from rapidlok_track_reader import RapidlokTrackReader, UNPACKED_TRIPLES_PER_SECTOR, process_unpacked_data
+from rapidlok_track_writer import SECTOR_PAYLOAD_SIZE, encode_track
+from scene_location import SCENE_LOCATIONS
+from score_simulator import ScoreSimulator
+from synthetic_images import build_dos_track, random_bytes, write_game_images
+from text_decoder import BYTES_PER_LINE, decode_packed_5bit_text, decode_text_areas
+
+RESULTS_VERSION = 1
+DEFAULT_REPEAT = 5
+DEFAULT_MAX_REGRESSION = 0.25
+# Each timed run lasts at least this long, loops per run are scaled up until it does
+MIN_RUN_TIME = 0.2
+
+
+class BenchmarkInputs:
+    """Deterministic inputs shared by every benchmark, built once from the seed."""
+
+    def __init__(self, seed, work_dir):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.gcr_sector = GCREncoder.encode_gcr_bytes(bytes([0x07]) + random_bytes(rng, 256) + bytes(3))
+        self.dos_track = pack_track(build_dos_track(1, rng)[0])
+        self.rapidlok_track = pack_track(encode_track(5, {s: random_bytes(rng, SECTOR_PAYLOAD_SIZE) for s in range(12)}))
+        self.triple_streams = [list(random_bytes(rng, UNPACKED_TRIPLES_PER_SECTOR)) for i in range(3)]
+        self.text_line = list(random_bytes(rng, BYTES_PER_LINE))
+        self.text_areas = [random_bytes(rng, TEXT_AREA_OFFSET + TOTAL_LINES * BYTES_PER_LINE) for i in range(len(SCENE_LOCATIONS))]
+        self.image_paths = write_game_images(work_dir, seed)
+        self.scenes_outcomes = {int(scene_id): random_bytes(rng, 64) for scene_id in SCENE_LOCATIONS}
+
+
+def bench_decode_gcr_bytes(inputs):
+    data = inputs.gcr_sector
+    return lambda: GCRDecoder.decode_gcr_bytes(data)
+
+
+def bench_gcr_read_track(inputs):
+    data = inputs.dos_track
+    return lambda: GCRTrackReader().read_track(1, data)
+
+
+def bench_rapidlok_read_track(inputs):
+    data = inputs.rapidlok_track
+    return lambda: RapidlokTrackReader(5, data)
+
+
+def bench_process_unpacked_data(inputs):
+    d1, d2, d3 = inputs.triple_streams
+    return lambda: process_unpacked_data(d1, d2, d3)
+
+
+def bench_decode_packed_5bit_text(inputs):
+    data = inputs.text_line
+    return lambda: decode_packed_5bit_text(data)
+
+
+def bench_decode_text_areas(inputs):
+    # The text of every scene
+    areas = inputs.text_areas
+    return lambda: decode_text_areas(areas, TEXT_AREA_OFFSET, TOTAL_LINES)
+
+
+def bench_pipeline(inputs):
+    # Both images opened, every track decoded, scenes assembled and the text dump written
+    side1_path, side2_path = inputs.image_paths
+
+    def run():
+        with G64(side1_path, use_mmap=True) as side_1, G64(side2_path, use_mmap=True) as side_2:
+            scenes_data = read_scenes_for_sides(
+                SCENE_LOCATIONS, [(side_1, SIDE1_EXCLUDED_TRACKS), (side_2, SIDE2_EXCLUDED_TRACKS)])
+        TextPathWriter(io.StringIO()).write_all(iter_scenes_dialogue_paths(scenes_data))
+    return run
+
+
+def bench_single_scene(inputs):
+    # Scene 4 only, decoded through the planner
+    side1_path, side2_path = inputs.image_paths
+
+    def run():
+        with G64(side1_path, use_mmap=True) as side_1, G64(side2_path, use_mmap=True) as side_2:
+            scenes_data = read_scenes_on_demand(SCENE_LOCATIONS, ["4"], side_1, side_2)
+        TextPathWriter(io.StringIO()).write_all(iter_scenes_dialogue_paths(scenes_data))
+    return run
+
+
+def bench_score_simulation(inputs):
+    # 10000 random games, pure Python
+    simulator = ScoreSimulator(OutcomeAnalytics(inputs.scenes_outcomes))
+    return lambda: simulator.run(10000, inputs.seed, use_numpy=False)
+
+
+BENCHMARKS = {
+    "gcr_decode_bytes": bench_decode_gcr_bytes,
+    "gcr_read_track": bench_gcr_read_track,
+    "rapidlok_read_track": bench_rapidlok_read_track,
+    "process_unpacked_data": bench_process_unpacked_data,
+    "decode_packed_5bit_text": bench_decode_packed_5bit_text,
+    "decode_text_areas": bench_decode_text_areas,
+    "pipeline": bench_pipeline,
+    "single_scene": bench_single_scene,
+    "score_simulation": bench_score_simulation,
+}
+
+
+def run_benchmark(function, repeat=DEFAULT_REPEAT) -> dict:
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < MIN_RUN_TIME:
+        number *= 10 if number < 1000 else 2
+    times = sorted(t / number for t in timer.repeat(repeat, number))
+    return {"number": number, "repeat": repeat, "best": times[0], "median": times[len(times) // 2]}
+
+
+def run_benchmarks(names, seed=0, repeat=DEFAULT_REPEAT, progress=None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        inputs = BenchmarkInputs(seed, work_dir)
+        for name in names:
+            results[name] = run_benchmark(BENCHMARKS[name](inputs), repeat)
+            if progress:
+                progress(name, results[name])
+    return {"version": RESULTS_VERSION, "python": platform.python_version(), "platform": platform.platform(),
+            "seed": seed, "benchmarks": results}
+
+
+def compare_results(results, baseline, max_regression=DEFAULT_MAX_REGRESSION) -> list[str]:
+    """Names of the benchmarks whose best time is more than max_regression slower than in the baseline."""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            continue
+        change = result["best"] / previous["best"] - 1
+        print(f"{name:<26}{previous['best'] * 1e6:>14.2f} us -> {result['best'] * 1e6:>12.2f} us  {change:+.1%}")
+        if change > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def print_result(name, result):
+    print(f"{name:<26}{result['best'] * 1e6:>14.2f} us  (median {result['median'] * 1e6:.2f} us, "
+          f"{result['repeat']} x {result['number']} runs)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the decoders on synthetic disk images")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all of them by default: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic inputs")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark, the best counts")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier run")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="fail when a benchmark is slower than the baseline by more than this fraction")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(unknown))
+
+    benchmark_results = run_benchmarks(args.names or list(BENCHMARKS), args.seed, args.repeat, print_result)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(benchmark_results, output, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            failed = compare_results(benchmark_results, json.load(baseline_file), args.max_regression)
+        if failed:
+            print("Regressions: " + ", ".join(failed))
+            sys.exit(1)
@@ -1,6 +1,8 @@
-from common_helpers import c_print, print_byte
+from common_helpers import print_byte
+from tracing import get_tracer
 
 MASK_8: int = 0xFF
+TRACER = get_tracer("bit_rotation")
 
 def rol(value: int, carry: int) -> tuple[int, int]:
     new_value = ((value << 1) | carry) & MASK_8
@@ -26,8 +28,10 @@ def generic_rotate_and_print(
         operation,
         operation_name: str,
 ) -> tuple[int, int]:
-    c_print(f"{operation_name} {name}")
+    if not TRACER.enabled:
+        return operation(value, carry)
+    TRACER.trace("%s %s", operation_name, name)
     value, carry = operation(value, carry)
-    print_byte(name, value)
-    c_print(f"Carry: {carry}")
+    print_byte(name, value, TRACER)
+    TRACER.trace("Carry: %d", carry)
     return value, carry
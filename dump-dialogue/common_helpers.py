@@ -1,4 +1,7 @@
-print_enabled = False
+#Underscored so that modules doing "from common_helpers import *" don't pick them up
+from tracing import get_tracer as _get_tracer
+
+_TRACER = _get_tracer("common_helpers")
 
 def hex_str(h, custom_format):
     return ''.join(custom_format.format(h).upper())
@@ -20,12 +23,13 @@ def bits_set_repr(b):
     s = s[:-1]
     return s
 
-def print_byte(x_name, x):
-    c_print(x_name + ": " + hex_str_8(x))
+def print_byte(x_name, x, tracer=_TRACER):
+    #Formats only when the tracer (the caller's module, or this one) is on
+    if tracer.enabled:
+        tracer.trace("%s: %s", x_name, hex_str_8(x))
 
-def c_print(s):
-    if print_enabled:
-        print(s)
+def c_print(s, tracer=_TRACER):
+    tracer.trace(s)
 
 def hex_str_8(h):
     return hex_str(h, '{:02x}')
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import struct
+import tempfile
+
+from disk_entities import Track
+
+# Bump whenever a change to the decoders changes their output, so stale entries are never read
+DECODER_VERSION = 1
+
+TRACK_MAGIC = b"LWTK"
+SCENES_MAGIC = b"LWSC"
+TRACK_EXTENSION = ".trk"
+SCENES_EXTENSION = ".scn"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Every entry ends with a hash of the rest, so truncated or corrupt entries are never used
+ENTRY_CHECKSUM_SIZE = 8
+
+
+class DecodeCache:
+    """On-disk cache of decoded Rapidlok tracks and assembled scenes.
+
+    Tracks are keyed by the G64 content fingerprint, the track number and DECODER_VERSION.
+    Scenes are keyed by the fingerprints of both sides and the scene locations.
+    Entries are small binary files; once the directory grows past max_bytes the least
+    recently used ones are deleted. An entry that is corrupt, or deleted by another process
+    while it is read, is a miss.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.entry_sizes = {}
+        for name in os.listdir(directory):
+            if name.endswith((TRACK_EXTENSION, SCENES_EXTENSION)):
+                self.entry_sizes[name] = os.path.getsize(os.path.join(directory, name))
+        self.total_size = sum(self.entry_sizes.values())
+
+    @staticmethod
+    def fingerprint(side_g64) -> str:
+        return hashlib.blake2b(side_g64.data, digest_size=16).hexdigest()
+
+    @staticmethod
+    def scenes_key(fingerprints, scene_locations) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for fingerprint in fingerprints:
+            h.update(fingerprint.encode())
+        for scene_id, loc in scene_locations.items():
+            h.update(f"{scene_id}:{loc.start_track}/{loc.start_sector}-{loc.end_track}/{loc.end_sector};".encode())
+        return h.hexdigest()
+
+    def get_track(self, fingerprint, track_num) -> Track:
+        name = self.track_entry_name(fingerprint, track_num)
+        data = self.read_entry(name)
+        if data is None:
+            return None
+        track = self.unpack_sectors(track_num, data)
+        if track is None:
+            self.delete_entry(name)
+        return track
+
+    def put_track(self, fingerprint, track_num, track: Track):
+        self.write_entry(self.track_entry_name(fingerprint, track_num), self.pack_sectors(track))
+
+    def get_scenes(self, key):
+        name = self.scenes_entry_name(key)
+        data = self.read_entry(name)
+        if data is None:
+            return None
+        scenes_data = self.unpack_scenes(data)
+        if scenes_data is None:
+            self.delete_entry(name)
+        return scenes_data
+
+    def put_scenes(self, key, scenes_data):
+        self.write_entry(self.scenes_entry_name(key), self.pack_scenes(scenes_data))
+
+    @staticmethod
+    def track_entry_name(fingerprint, track_num):
+        return f"{fingerprint}_{track_num:02d}_v{DECODER_VERSION}{TRACK_EXTENSION}"
+
+    @staticmethod
+    def scenes_entry_name(key):
+        return f"{key}_v{DECODER_VERSION}{SCENES_EXTENSION}"
+
+    @staticmethod
+    def pack_sectors(track: Track) -> bytes:
+        # magic, sector count, then (sector number, length, payload) per sector
+        parts = [TRACK_MAGIC, struct.pack("<H", len(track))]
+        for sector_number in track:
+            payload = track.get_payload(sector_number)
+            parts.append(struct.pack("<BH", sector_number, len(payload)))
+            parts.append(payload)
+        return b"".join(parts)
+
+    @staticmethod
+    def unpack_sectors(track_num, data):
+        # The entry itself is the buffer of the track, its sectors pointing past their headers
+        if data[:4] != TRACK_MAGIC:
+            return None
+        try:
+            count, = struct.unpack_from("<H", data, 4)
+            pos = 6
+            sector_ranges = {}
+            for i in range(count):
+                sector_number, length = struct.unpack_from("<BH", data, pos)
+                pos += 3
+                sector_ranges[sector_number] = (pos, pos + length)
+                pos += length
+        except struct.error:
+            return None
+        if pos != len(data):
+            return None
+        return Track(track_num, data, sector_ranges)
+
+    @staticmethod
+    def pack_scenes(scenes_data) -> bytes:
+        # magic, scene count, then (id length, id, data length, data) per scene
+        parts = [SCENES_MAGIC, struct.pack("<H", len(scenes_data))]
+        for scene_id, scene_data in scenes_data.items():
+            encoded_id = scene_id.encode()
+            parts.append(struct.pack("<B", len(encoded_id)))
+            parts.append(encoded_id)
+            parts.append(struct.pack("<I", len(scene_data)))
+            parts.append(bytes(scene_data))
+        return b"".join(parts)
+
+    @staticmethod
+    def unpack_scenes(data):
+        if data[:4] != SCENES_MAGIC:
+            return None
+        try:
+            count, = struct.unpack_from("<H", data, 4)
+            pos = 6
+            scenes_data = {}
+            for i in range(count):
+                id_length = data[pos]
+                scene_id = data[pos + 1:pos + 1 + id_length].decode()
+                pos += 1 + id_length
+                length, = struct.unpack_from("<I", data, pos)
+                pos += 4
+                scenes_data[scene_id] = data[pos:pos + length]
+                pos += length
+        except (struct.error, IndexError, UnicodeDecodeError):
+            return None
+        if pos != len(data):
+            return None
+        return scenes_data
+
+    @staticmethod
+    def get_checksum(data) -> bytes:
+        return hashlib.blake2b(data, digest_size=ENTRY_CHECKSUM_SIZE).digest()
+
+    def read_entry(self, name):
+        """The data of an entry, None if it is missing, vanished or corrupt (corrupt ones are deleted)."""
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            # Reads count as use for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another process in the meantime
+            self.forget_entry(name)
+            return None
+        data, checksum = data[:-ENTRY_CHECKSUM_SIZE], data[-ENTRY_CHECKSUM_SIZE:]
+        if len(checksum) != ENTRY_CHECKSUM_SIZE or self.get_checksum(data) != checksum:
+            self.delete_entry(name)
+            return None
+        return data
+
+    def delete_entry(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        self.forget_entry(name)
+
+    def forget_entry(self, name):
+        self.total_size -= self.entry_sizes.pop(name, 0)
+
+    def write_entry(self, name, data):
+        path = os.path.join(self.directory, name)
+        data += self.get_checksum(data)
+        # A temp file of its own, so processes writing the same entry never share one
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        self.total_size += len(data) - self.entry_sizes.get(name, 0)
+        self.entry_sizes[name] = len(data)
+        if self.total_size > self.max_bytes:
+            self.evict(keep=name)
+
+    def evict(self, keep=None):
+        # Delete least recently used entries until the cache fits in max_bytes again
+        entries = []
+        for name in self.entry_sizes:
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.directory, name)), name))
+            except FileNotFoundError:
+                entries.append((0, name))
+        for mtime, name in sorted(entries):
+            if self.total_size <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self.delete_entry(name)
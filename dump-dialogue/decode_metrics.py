@@ -0,0 +1,120 @@
+import json
+import time
+from contextlib import nullcontext
+
+# Counters collected while decoding, with their description
+COUNTERS = {
+    "image_bytes": "Bytes of G64 images opened",
+    "bytes_scanned": "Track bytes scanned for sector headers",
+    "bits_scanned": "Track bits scanned for GCR syncs",
+    "sync_runs": "GCR sync runs found",
+    "tracks_decoded": "Tracks decoded",
+    "headers_found": "Sector headers found",
+    "headers_missing": "Expected sector headers not found",
+    "headers_duplicated": "Sector headers found more than once on a track",
+    "gcr_errors": "Bytes decoded from invalid GCR codes",
+    "sectors_unformatted": "Sectors with a header but no payload, skipped",
+    "sectors_decoded": "Sectors decoded",
+    "sectors_bad_data": "GCR sectors whose data block has invalid GCR codes or a bad checksum",
+    "cache_hits": "Tracks or scenes read from the decode cache",
+    "track_lru_hits": "Decoded tracks reused from the G64 in-memory LRU",
+    "scenes_assembled": "Scenes assembled from their sectors",
+    "scene_bytes": "Bytes of assembled scenes",
+}
+PROMETHEUS_PREFIX = "lotw_decode"
+
+
+class DecodeMetrics:
+    """Counters and wall time per stage of a decode, passed down to G64, the track readers
+    and read_scenes. Code with expensive counts checks enabled first, see NULL_METRICS."""
+
+    enabled = True
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.stage_seconds: dict[str, float] = {}
+        self.stage_calls: dict[str, int] = {}
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def add_stage_time(self, name, seconds, calls=1):
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+        self.stage_calls[name] = self.stage_calls.get(name, 0) + calls
+
+    def merge(self, other):
+        """Add metrics collected elsewhere, e.g. by a worker process (a DecodeMetrics or its to_dict)."""
+        if isinstance(other, DecodeMetrics):
+            other = other.to_dict()
+        for name, value in other["counters"].items():
+            self.count(name, value)
+        for name, stage in other["stages"].items():
+            self.add_stage_time(name, stage["seconds"], stage["calls"])
+
+    def to_dict(self) -> dict:
+        return {"counters": dict(self.counters),
+                "stages": {name: {"seconds": seconds, "calls": self.stage_calls[name]}
+                           for name, seconds in self.stage_seconds.items()}}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX) -> str:
+        lines = []
+        for name in sorted(self.counters):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {self.counters[name]}")
+        if self.stage_seconds:
+            lines.append(f"# HELP {prefix}_stage_seconds_total Wall time spent in each decode stage")
+            lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+            for name in sorted(self.stage_seconds):
+                lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {self.stage_seconds[name]:.6f}')
+            lines.append(f"# HELP {prefix}_stage_calls_total Times each decode stage ran")
+            lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+            for name in sorted(self.stage_calls):
+                lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {self.stage_calls[name]}')
+        return "\n".join(lines) + "\n"
+
+    def save(self, filename, output_format="json"):
+        with open(filename, "w") as file:
+            file.write(self.to_prometheus() if output_format == "prometheus" else self.to_json())
+
+
+class StageTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_stage_time(self.name, time.perf_counter() - self.start)
+
+
+class NullMetrics(DecodeMetrics):
+    """Metrics turned off: every method is a no-op and stage() hands out one shared context."""
+
+    enabled = False
+    NULL_STAGE = nullcontext()
+
+    def count(self, name, value=1):
+        pass
+
+    def stage(self, name):
+        return self.NULL_STAGE
+
+    def add_stage_time(self, name, seconds, calls=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+
+NULL_METRICS = NullMetrics()
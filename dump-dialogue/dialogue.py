@@ -0,0 +1,145 @@
+import sys
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from typing import Optional
+
+from dialogue_writers import TextPathWriter
+from text_decoder import decode_text_areas
+
+WOMAN_SCENES = (2, 7, 10)
+
+DOCTOR_SCENE = 4
+
+# Where the dialogue lines start in a scene, and how many there are
+TEXT_AREA_OFFSET: int = 0x140
+TOTAL_LINES: int = 169
+
+
+def get_sheriff_lines_for(character_line: int) -> list[int]:
+    return list(range(character_line + 1, character_line + 5))
+
+
+def get_char_line_for_sheriff_line_tier1(sheriff_line: int) -> int:
+    return sheriff_line * 5
+
+
+def get_char_line_for_sheriff_line_tier2(sheriff_line: int) -> int:
+    b = ((sheriff_line // 5) - 1) * 4
+    c = b + (sheriff_line % 5) - 1
+    return c * 5 + 25
+
+
+def get_char_line_for_sheriff_line_tier3(sheriff_line: int) -> int:
+    b = ((sheriff_line // 5) - 5) * 4
+    return b + (sheriff_line % 5) + 105 - 1
+
+
+def get_authority_for_final_line_woman(outcome: int) -> int:
+    authority = [0, 0, 0, 0, 6, 6, 6, 6]
+    return authority[outcome // 32]
+
+def get_authority_for_final_line_man(outcome: int) -> int:
+    return outcome // 32
+
+def get_romance_for_final_line(outcome: int) -> int:
+    romance = [0, 1, 2, 3, 0, 1, 2, 3]
+    return romance[outcome // 32]
+
+def get_doctor_state_for_final_line(outcome: int):
+    doctor_state = [0, 0, 1, 2, 0, 0, 0, 3]
+    state_descriptions = {0 : "out of town", 1 : "drunk", 2 : "hostile", 3 : "friendly"}
+    state = doctor_state[outcome // 32]
+    return state_descriptions[state]
+
+def get_character_state_from_outcome(outcome: int):
+    states = {
+    #Commented states will not happen as an immediate outcome of the dialogue but are included for completeness
+    #0 :	"Standing still (waiting for dialogue)",
+    1 :	"Draw gun - Slow (delay of 5)",
+    2 :	"Leave right but draw gun if sheriff draws",
+    3 :	"Walk away then leave right",
+    4 :	"Surrender", #Not sure about the real difference between 4 and 5
+    5 :	"Surrender",
+    6 :	"Leave right but surrender if sheriff draws",
+    7 :	"Gang shootout",
+    8 :	"Walk right, then away (and then leave right)",    #This state will always transition to state #03
+    9 :	"Draw gun - Fast (delay of 2)",
+    #10 :	"Entering scene and walking towards center of street",
+    #11 : 	"Entering scene and walking towards center of street",
+    #12 :	"Running around and shooting",
+    #13 :	"Falling down after being shot",
+    #14 :	"Shooting",
+    15 :	"Walk away then leaving left",
+    #16 :	"Walking toward sheriff before starting a conversation",
+    #17 :	"Walking away then leaving right",
+    18 :	"Leave, about to shoot from the street",
+    19 :	"Draw gun - Very Fast (delay of 1)",
+    #20 :	"Preparing to shoot from scene's edge",
+    21 :	"Leave and shoot on exit",
+    #22 :	"Talking"
+    }
+
+    return states[outcome & 0x1F]
+
+
+@dataclass
+class DialoguePath:
+    """One full conversation: the 7 lines spoken, the 3 sheriff selections (1..4) and its outcome."""
+    scene: int
+    lines: tuple[str, ...]
+    selections: tuple[int, int, int]
+    outcome: int
+    authority: int
+    romance: Optional[int]
+    doctor_state: Optional[str]
+    npc_state: str
+
+
+def iter_dialogue_paths(_lines: Sequence[str], scene_number: int, scene_data: Sequence[int]) -> Iterator[DialoguePath]:
+    """Yield the 64 paths through a scene's dialogue tree, in the order of the text dump."""
+    c1 = 0
+    for s1 in get_sheriff_lines_for(c1):
+        c2 = get_char_line_for_sheriff_line_tier1(s1)
+        for s2 in get_sheriff_lines_for(c2):
+            c3 = get_char_line_for_sheriff_line_tier2(s2)
+            for s3 in get_sheriff_lines_for(c3):
+                c4 = get_char_line_for_sheriff_line_tier3(s3)
+                path_lines = (_lines[c1], _lines[s1], _lines[c2], _lines[s2], _lines[c3], _lines[s3], _lines[c4])
+                selections = (s1 - c1, s2 - c2, s3 - c3)
+                outcome = scene_data[get_outcome_offset(selections)]
+                yield build_dialogue_path(scene_number, path_lines, selections, outcome)
+
+
+def iter_scenes_dialogue_paths(_scenes_data) -> Iterator[DialoguePath]:
+    """Yield every path of every scene, as read by read_scenes."""
+    scenes_lines = decode_text_areas(_scenes_data.values(), TEXT_AREA_OFFSET, TOTAL_LINES)
+    for (scene_id, scene_data), _lines in zip(_scenes_data.items(), scenes_lines):
+        yield from iter_dialogue_paths(_lines, int(scene_id), scene_data)
+
+
+def build_dialogue_path(scene_number: int, path_lines, selections, outcome: int) -> DialoguePath:
+    romance = None
+    doctor_state = None
+    if scene_number in WOMAN_SCENES:
+        authority = get_authority_for_final_line_woman(outcome)
+        romance = get_romance_for_final_line(outcome)
+    else:
+        authority = get_authority_for_final_line_man(outcome)
+        if scene_number == DOCTOR_SCENE:
+            doctor_state = get_doctor_state_for_final_line(outcome)
+    return DialoguePath(scene_number, path_lines, selections, outcome, authority, romance, doctor_state,
+                        get_character_state_from_outcome(outcome))
+
+
+def print_dialogue_tree(_lines: Sequence[str], scene_number: int, scene_data: Sequence[int]):
+    with TextPathWriter(sys.stdout, scene_headers=False) as writer:
+        writer.write_all(iter_dialogue_paths(_lines, scene_number, scene_data))
+
+
+def get_outcome_offset(selections) -> int:
+    sheriff_line_index = selections[0] * 16 + selections[1] * 4 + selections[2]
+    return sheriff_line_index - 0x15
+
+
+def get_outcome_from_selections(scene_number: int, selections: list[int], _scenes_data) -> int:
+    return _scenes_data[str(scene_number)][get_outcome_offset(selections)]
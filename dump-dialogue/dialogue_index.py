@@ -0,0 +1,156 @@
+import struct
+from array import array
+
+from dialogue import (DOCTOR_SCENE, TEXT_AREA_OFFSET, TOTAL_LINES, WOMAN_SCENES, DialoguePath,
+                      build_dialogue_path, get_authority_for_final_line_man, get_authority_for_final_line_woman,
+                      get_char_line_for_sheriff_line_tier1, get_char_line_for_sheriff_line_tier2,
+                      get_char_line_for_sheriff_line_tier3, get_outcome_offset, get_romance_for_final_line,
+                      get_sheriff_lines_for)
+from text_decoder import decode_text_area, decode_text_areas
+
+PATHS_PER_SCENE = 64
+LINES_PER_PATH = 7
+SYMBOLS_PER_LINE = 40
+DOCTOR_STATES = (0, 0, 1, 2, 0, 0, 0, 3)
+NO_METRIC = -1
+
+INDEX_MAGIC = b"LWDI"
+INDEX_VERSION = 2
+
+
+def build_path_line_ids() -> array:
+    # The tree layout is the same in every scene: line ids of all 64 paths, 7 per path,
+    # stored at the path's outcome offset so selections map straight to a row
+    line_ids = array("B", bytes(PATHS_PER_SCENE * LINES_PER_PATH))
+    c1 = 0
+    for s1 in get_sheriff_lines_for(c1):
+        c2 = get_char_line_for_sheriff_line_tier1(s1)
+        for s2 in get_sheriff_lines_for(c2):
+            c3 = get_char_line_for_sheriff_line_tier2(s2)
+            for s3 in get_sheriff_lines_for(c3):
+                c4 = get_char_line_for_sheriff_line_tier3(s3)
+                row = get_outcome_offset((s1 - c1, s2 - c2, s3 - c3)) * LINES_PER_PATH
+                line_ids[row:row + LINES_PER_PATH] = array("B", (c1, s1, c2, s2, c3, s3, c4))
+    return line_ids
+
+
+PATH_LINE_IDS = build_path_line_ids()
+
+
+def get_selections_for_path(path_index: int) -> tuple[int, int, int]:
+    return (path_index >> 4) + 1, ((path_index >> 2) & 3) + 1, (path_index & 3) + 1
+
+
+class SceneIndex:
+    """Precompiled paths of one scene: the 64 outcomes, decoded metrics and the line text,
+    all addressed by path index (the outcome offset of the selections)."""
+
+    def __init__(self, scene_number: int, lines, outcomes: bytes):
+        self.scene_number = scene_number
+        self.lines = tuple(lines)
+        self.outcomes = bytes(outcomes[:PATHS_PER_SCENE])
+        self.build_metrics()
+
+    def build_metrics(self):
+        self.authority = array("b")
+        self.romance = array("b")
+        self.doctor_state = array("b")
+        self.paths_by_outcome: dict[int, list[int]] = {}
+        self.paths_by_state: dict[int, list[int]] = {}
+        is_woman = self.scene_number in WOMAN_SCENES
+        for path_index, outcome in enumerate(self.outcomes):
+            if is_woman:
+                self.authority.append(get_authority_for_final_line_woman(outcome))
+                self.romance.append(get_romance_for_final_line(outcome))
+            else:
+                self.authority.append(get_authority_for_final_line_man(outcome))
+                self.romance.append(NO_METRIC)
+            self.doctor_state.append(DOCTOR_STATES[outcome >> 5] if self.scene_number == DOCTOR_SCENE else NO_METRIC)
+            self.paths_by_outcome.setdefault(outcome, []).append(path_index)
+            self.paths_by_state.setdefault(outcome & 0x1F, []).append(path_index)
+
+    @classmethod
+    def from_scene_data(cls, scene_number: int, scene_data):
+        return cls(scene_number, decode_text_area(scene_data, TEXT_AREA_OFFSET, TOTAL_LINES), scene_data[:PATHS_PER_SCENE])
+
+    def lookup(self, selections) -> tuple[tuple[str, ...], int]:
+        """Lines spoken and outcome byte for the selections (a, b, c), each 1..4."""
+        if len(selections) != 3 or any(not 1 <= s <= 4 for s in selections):
+            raise Exception("Invalid selections %s, expected 3 choices of 1 to 4" % (tuple(selections),))
+        path_index = get_outcome_offset(selections)
+        row = path_index * LINES_PER_PATH
+        line_ids = PATH_LINE_IDS[row:row + LINES_PER_PATH]
+        return tuple(self.lines[i] for i in line_ids), self.outcomes[path_index]
+
+    def get_path(self, selections) -> DialoguePath:
+        path_lines, outcome = self.lookup(selections)
+        return build_dialogue_path(self.scene_number, path_lines, tuple(selections), outcome)
+
+    def paths_with_outcome(self, outcome: int) -> list[tuple[int, int, int]]:
+        return [get_selections_for_path(i) for i in self.paths_by_outcome.get(outcome, [])]
+
+    def paths_with_state(self, state: int) -> list[tuple[int, int, int]]:
+        """Selections leading to an NPC state (the low 5 bits of the outcome)."""
+        return [get_selections_for_path(i) for i in self.paths_by_state.get(state, [])]
+
+
+class DialogueIndex:
+    """Compiled dialogue of every scene, serializable so it can be used without the disk images."""
+
+    def __init__(self, scenes):
+        self.scenes: dict[int, SceneIndex] = {scene.scene_number: scene for scene in scenes}
+
+    def __getitem__(self, scene_number: int) -> SceneIndex:
+        return self.scenes[scene_number]
+
+    @classmethod
+    def from_scenes_data(cls, _scenes_data):
+        scenes_lines = decode_text_areas(_scenes_data.values(), TEXT_AREA_OFFSET, TOTAL_LINES)
+        return cls(SceneIndex(int(scene_id), _lines, scene_data[:PATHS_PER_SCENE])
+                   for (scene_id, scene_data), _lines in zip(_scenes_data.items(), scenes_lines))
+
+    def paths_with_outcome(self, outcome: int) -> dict[int, list[tuple[int, int, int]]]:
+        return {n: scene.paths_with_outcome(outcome) for n, scene in self.scenes.items() if outcome in scene.paths_by_outcome}
+
+    def to_bytes(self) -> bytes:
+        # magic, version, scene count, then per scene: number, symbol count, 64 outcome bytes and the
+        # lines of 40 symbols back to back (the last one shorter in a scene cut short)
+        parts = [INDEX_MAGIC, struct.pack("<BB", INDEX_VERSION, len(self.scenes))]
+        for scene in self.scenes.values():
+            text = "".join(scene.lines).encode("ascii")
+            parts.append(struct.pack("<BH", scene.scene_number, len(text)))
+            parts.append(scene.outcomes)
+            parts.append(text)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        if data[:4] != INDEX_MAGIC or data[4:5] != bytes((INDEX_VERSION,)):
+            raise Exception("Not a dialogue index, or an unsupported version")
+        try:
+            count = data[5]
+            pos = 6
+            scenes = []
+            for i in range(count):
+                scene_number, total_symbols = struct.unpack_from("<BH", data, pos)
+                pos += 3
+                outcomes = data[pos:pos + PATHS_PER_SCENE]
+                pos += PATHS_PER_SCENE
+                text = data[pos:pos + total_symbols].decode("ascii")
+                pos += total_symbols
+                lines = [text[j:j + SYMBOLS_PER_LINE] for j in range(0, len(text), SYMBOLS_PER_LINE)]
+                scenes.append(SceneIndex(scene_number, lines, outcomes))
+        except (IndexError, struct.error):
+            raise Exception("Dialogue index is truncated")
+        if pos != len(data):
+            raise Exception("Dialogue index is truncated or has trailing data")
+        return cls(scenes)
+
+    def save(self, filename):
+        with open(filename, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as file:
+            return cls.from_bytes(file.read())
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+
+DEFAULT_BUFFER_SIZE = 1024
+
+SPEAKERS = ("      NPC", "  Sheriff", "      NPC", "  Sheriff", "      NPC", "  Sheriff", "      NPC")
+
+CSV_FIELDS = ["scene",
+              "npc_1", "sheriff_1", "npc_2", "sheriff_2", "npc_3", "sheriff_3", "npc_4",
+              "selection_1", "selection_2", "selection_3",
+              "outcome", "authority", "romance", "doctor_state", "npc_state"]
+
+
+class DialoguePathWriter:
+    """Buffered writer of DialoguePath records: formatted paths are collected and written
+    to the stream buffer_size records at a time."""
+
+    def __init__(self, stream, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer: list[str] = []
+        self.started = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def write(self, path):
+        if not self.started:
+            self.started = True
+            self.buffer.append(self.format_header())
+        self.buffer.append(self.format_path(path))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, paths):
+        for path in paths:
+            self.write(path)
+        self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.buffer.clear()
+        self.stream.flush()
+
+    def format_header(self) -> str:
+        return ""
+
+    def format_path(self, path) -> str:
+        raise NotImplementedError
+
+
+class TextPathWriter(DialoguePathWriter):
+    """The human readable dump, one block per path, with a banner before each scene."""
+
+    def __init__(self, stream, buffer_size=DEFAULT_BUFFER_SIZE, scene_headers=True):
+        super().__init__(stream, buffer_size)
+        self.scene_headers = scene_headers
+        self.current_scene = None
+
+    def format_path(self, path) -> str:
+        parts = []
+        if self.scene_headers and path.scene != self.current_scene:
+            parts.append(f"{'=' * 20} Scene {path.scene} {'=' * 20}\n")
+        self.current_scene = path.scene
+
+        for speaker, line in zip(SPEAKERS, path.lines):
+            parts.append(f"{speaker}: {line}\n")
+        parts.append(f"Authority: {path.authority}\n")
+        if path.romance is not None:
+            parts.append(f"Romance: {path.romance}\n")
+        if path.doctor_state is not None:
+            parts.append(f"Doctor state: {path.doctor_state}\n")
+        parts.append(f"NPC State: {path.npc_state}\n\n\n")
+        return "".join(parts)
+
+
+class JsonLinesPathWriter(DialoguePathWriter):
+    """One JSON object per path."""
+
+    def format_path(self, path) -> str:
+        record = {
+            "scene": path.scene,
+            "lines": path.lines,
+            "selections": path.selections,
+            "outcome": path.outcome,
+            "authority": path.authority,
+            "romance": path.romance,
+            "doctor_state": path.doctor_state,
+            "npc_state": path.npc_state,
+        }
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+class CsvPathWriter(DialoguePathWriter):
+    """One CSV row per path, under a header row with CSV_FIELDS."""
+
+    def __init__(self, stream, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__(stream, buffer_size)
+        self.row_buffer = io.StringIO()
+        self.row_writer = csv.writer(self.row_buffer)
+
+    def format_row(self, row) -> str:
+        self.row_buffer.seek(0)
+        self.row_buffer.truncate()
+        self.row_writer.writerow(row)
+        return self.row_buffer.getvalue()
+
+    def format_header(self) -> str:
+        return self.format_row(CSV_FIELDS)
+
+    def format_path(self, path) -> str:
+        return self.format_row([path.scene, *path.lines, *path.selections, path.outcome, path.authority,
+                                "" if path.romance is None else path.romance,
+                                "" if path.doctor_state is None else path.doctor_state,
+                                path.npc_state])
+
+
+WRITERS = {
+    "text": TextPathWriter,
+    "jsonl": JsonLinesPathWriter,
+    "csv": CsvPathWriter,
+}
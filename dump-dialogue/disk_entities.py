@@ -1,3 +1,4 @@
+from array import array
 from dataclasses import dataclass
 
 from common_helpers import *
@@ -5,25 +6,20 @@ from gcr_decoder import GCRDecoder
 
 
 class SectorHeader:
+    __slots__ = ("data", "block_id", "block_checksum", "sector", "track", "format_id_2", "format_id_1")
+
     def __init__(self, data):
         self.data = data
         self.parse_header()
 
     def parse_header(self):
         header_bytes = self.decode_header(self.data)
-        attributes = [
-            "block_id",
-            "block_checksum",
-            "sector",
-            "track",
-            "format_id_2",
-            "format_id_1"
-            ]
-
-        for i in range(0, len(attributes)):
-            setattr(self, attributes[i], header_bytes[i])
+        (self.block_id, self.block_checksum, self.sector, self.track,
+         self.format_id_2, self.format_id_1) = header_bytes[:6]
 
-        self.format_id = chr(self.format_id_1) + chr(self.format_id_2)
+    @property
+    def format_id(self):
+        return chr(self.format_id_1) + chr(self.format_id_2)
 
     def decode_header(self, header_info):
         return GCRDecoder.decode_gcr_bytes(header_info)
@@ -36,6 +32,8 @@ class SectorHeader:
         return s
 
 class Sector:
+    __slots__ = ("header", "data")
+
     def __init__(self, header, data):
         self.header = header
         self.data = data
@@ -47,28 +45,81 @@ class Sector:
         return s
 
 class Track:
-    def __init__(self, track_number, sectors, raw_data):
+    """The decoded sectors of a track, their payloads kept in one buffer.
+
+    sector_ranges gives the (start, end) of each sector payload in data, and track[n] is a
+    memoryview of it. Tracks read by GCRTrackReader also keep the sector headers, and
+    track[n] is then a Sector. raw_data, the undecoded track, is optional.
+    """
+
+    __slots__ = ("track_number", "data", "offsets", "headers", "raw_data")
+    MISSING_SECTOR = -1
+
+    def __init__(self, track_number, data=b"", sector_ranges=None, headers=None, raw_data=None):
         self.track_number = track_number
-        self.sectors = sectors
+        self.data = data
+        #start, end of sector n at 2n, 2n+1. A dict of tuples would take more than the payloads' checksums.
+        sector_ranges = sector_ranges or {}
+        self.offsets = array("i", [self.MISSING_SECTOR]) * (2 * (max(sector_ranges, default=-1) + 1))
+        for sector_number, (start, end) in sector_ranges.items():
+            self.offsets[2 * sector_number] = start
+            self.offsets[2 * sector_number + 1] = end
+        self.headers: dict[int, SectorHeader] = headers
         self.raw_data = raw_data
 
+    @classmethod
+    def from_sectors(cls, track_number, payloads, headers=None, raw_data=None):
+        """A track from {sector number: payload}, the payloads joined into one buffer."""
+        sector_ranges = {}
+        position = 0
+        for sector_number, payload in payloads.items():
+            sector_ranges[sector_number] = (position, position + len(payload))
+            position += len(payload)
+        return cls(track_number, b"".join(payloads.values()), sector_ranges, headers, raw_data)
+
+    def get_payload(self, key) -> memoryview:
+        if key not in self:
+            raise KeyError(key)
+        return memoryview(self.data)[self.offsets[2 * key]:self.offsets[2 * key + 1]]
+
     def __getitem__(self, key):
-        return self.sectors[key]
+        if self.headers is None:
+            return self.get_payload(key)
+        return Sector(self.headers[key], self.get_payload(key))
+
+    def __contains__(self, key):
+        return 0 <= key < len(self.offsets) // 2 and self.offsets[2 * key] != self.MISSING_SECTOR
+
+    def __iter__(self):
+        #Sector numbers, in order
+        starts = self.offsets[0::2]
+        return (sector_number for sector_number, start in enumerate(starts) if start != self.MISSING_SECTOR)
+
+    def __len__(self):
+        return len(self.offsets) // 2 - self.offsets[0::2].count(self.MISSING_SECTOR)
+
+    @property
+    def sectors(self):
+        # Built on each call, prefer track[n], n in track and len(track)
+        return {sector_number: self[sector_number] for sector_number in self}
 
     def get_total_sectors(self):
-        return len(self.sectors)
+        return len(self)
 
     def __repr__(self):
         s = "Track " + str(self.track_number) + "\n"
-        s += "\n" + repr_hex_bytes(self.raw_data) + "\n"
+        if self.raw_data is not None:
+            s += "\n" + repr_hex_bytes(self.raw_data) + "\n"
 
-        for sector_id, sector in self.sectors.items():
+        for sector_id in self:
             s += "\nSector " + str(sector_id) + "\n"
-            s += str(sector)
+            s += str(self[sector_id]) if self.headers is not None else repr_hex_bytes(self.get_payload(sector_id))
         return s
 
 @dataclass
 class DiskLocation:
+    __slots__ = ("side", "track", "sector", "offset")
+
     side: int
     track: int
     sector: int
@@ -0,0 +1,252 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from decode_cache import DecodeCache
+from decode_metrics import NULL_METRICS, DecodeMetrics
+from disk_entities import Track, TrackId
+from g64 import G64
+from rapidlok_track_reader import RapidlokTrackReader
+
+FIRST_TRACK: int = 1
+LAST_TRACK: int = 35
+LOAD_ADDRESS_SIZE: int = 2
+SIDE1_SCENES = {"1", "2", "3", "4"}
+# Tracks of each side that are not in Rapidlok format
+SIDE1_EXCLUDED_TRACKS = (1, 17, 18)
+SIDE2_EXCLUDED_TRACKS = tuple(range(9, 22))
+
+# The G64 image a worker process is decoding tracks of. Jobs come in side order, so it is
+# only closed and replaced when a job for the other side arrives.
+_worker_image: G64 = None
+
+
+class SectorNotFoundError(Exception):
+    """A sector a scene needs is not in its decoded track."""
+
+    def __init__(self, scene_id: str, side_number: int, track_num: int, sector: int):
+        super().__init__("Scene %s needs track %d sector %d of side %d, which could not be read"
+                         % (scene_id, track_num, sector, side_number))
+        self.scene_id = scene_id
+        self.side_number = side_number
+        self.track_num = track_num
+        self.sector = sector
+
+
+def get_track_numbers(excluded_tracks) -> list[int]:
+    excluded = set(excluded_tracks)
+    return [n for n in range(FIRST_TRACK, LAST_TRACK + 1) if n not in excluded]
+
+
+def read_tracks_for_side(side_g64: G64, excluded_tracks, workers: int = 0, metrics: DecodeMetrics = None):
+    """Read all tracks for a side, skipping excluded track numbers (1..35).
+
+    With workers > 1 tracks are decoded in a process pool, see read_tracks_for_sides.
+    """
+    return read_tracks_for_sides([(side_g64, excluded_tracks)], workers, metrics=metrics)[0]
+
+
+def read_tracks_for_sides(sides, workers: int = 0, cache: DecodeCache = None, metrics: DecodeMetrics = None,
+                          fingerprints=None):
+    """Read the tracks of several sides, given as (G64, excluded_tracks) pairs.
+
+    Returns one {track_num: Track} dict per side, in the same order.
+    workers is the number of worker processes: None uses every CPU, 0 or 1 decodes
+    serially in this process (easier to debug). Workers only receive the image
+    filename and a track number and map the track themselves, so no track data is
+    pickled on the way in and only the decoded sectors come back.
+    With a cache, only tracks missing from it are decoded, and they are added to it.
+    Metrics counted by workers are sent back and merged into metrics.
+    fingerprints are the cache fingerprints of the sides, when the caller has them already.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    metrics = metrics or NULL_METRICS
+
+    if fingerprints is None:
+        fingerprints = [cache.fingerprint(side_g64) if cache else None for side_g64, excluded_tracks in sides]
+    results = {}
+    jobs = []
+    for side_index, (side_g64, excluded_tracks) in enumerate(sides):
+        for track_num in get_track_numbers(excluded_tracks):
+            track = cache.get_track(fingerprints[side_index], track_num) if cache else None
+            if track is None:
+                jobs.append((side_index, side_g64.filename, track_num))
+            else:
+                metrics.count("cache_hits")
+                results[(side_index, track_num)] = track
+
+    if workers <= 1 or len(jobs) <= 1:
+        decoded = [_decode_track(sides[side_index][0], track_num, metrics) for side_index, filename, track_num in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_size = max(1, len(jobs) // (workers * 4))
+            worker_jobs = [(filename, track_num, metrics.enabled) for side_index, filename, track_num in jobs]
+            decoded = []
+            for track, worker_metrics in executor.map(_decode_track_job, worker_jobs, chunksize=chunk_size):
+                decoded.append(track)
+                if worker_metrics:
+                    metrics.merge(worker_metrics)
+
+    for (side_index, filename, track_num), track in zip(jobs, decoded):
+        results[(side_index, track_num)] = track
+        if cache:
+            cache.put_track(fingerprints[side_index], track_num, track)
+
+    # Decoded tracks only: the raw tracks stay in the G64 images
+    sides_tracks = [{} for _ in sides]
+    for side_index, (side_g64, excluded_tracks) in enumerate(sides):
+        for track_num in get_track_numbers(excluded_tracks):
+            sides_tracks[side_index][track_num] = results[(side_index, track_num)]
+    return sides_tracks
+
+
+def read_scenes_for_sides(_scene_locations, sides, workers: int = 0, cache: DecodeCache = None,
+                          metrics: DecodeMetrics = None):
+    """Decode both sides and assemble the scenes, straight from the cache when it has them."""
+    fingerprints = None
+    if cache:
+        # Hashing a side reads the whole image, do it once for the scenes and the tracks
+        fingerprints = [cache.fingerprint(side_g64) for side_g64, excluded_tracks in sides]
+        key = cache.scenes_key(fingerprints, _scene_locations)
+        scenes_data = cache.get_scenes(key)
+        if scenes_data is not None:
+            if metrics:
+                metrics.count("cache_hits")
+            return scenes_data
+
+    side1_tracks, side2_tracks = read_tracks_for_sides(sides, workers, cache, metrics, fingerprints)
+    scenes_data = read_scenes(_scene_locations, side1_tracks, side2_tracks, metrics)
+    if cache:
+        cache.put_scenes(key, scenes_data)
+    return scenes_data
+
+
+def _decode_track(side_g64: G64, track_num: int, metrics: DecodeMetrics = None) -> Track:
+    reader = RapidlokTrackReader(track_num, _get_raw_track(side_g64, track_num), metrics)
+    return reader.get_track()
+
+
+def _get_raw_track(side_g64: G64, track_num: int):
+    track_id = _get_track_id(track_num)
+    if track_id not in side_g64:
+        raise Exception("Track %d is not in %s" % (track_num, side_g64.filename))
+    return side_g64[track_id]
+
+
+def _decode_track_job(job):
+    global _worker_image
+    filename, track_num, collect_metrics = job
+    if _worker_image is None or _worker_image.filename != filename:
+        if _worker_image is not None:
+            _worker_image.close()
+            _worker_image = None
+        _worker_image = G64(filename, use_mmap=True)
+    side_g64 = _worker_image
+    metrics = DecodeMetrics() if collect_metrics else None
+    # A Track pickles as its buffer and sector offsets
+    track = _decode_track(side_g64, track_num, metrics)
+    return track, metrics.to_dict() if metrics else None
+
+
+def _get_track_id(track_num: int) -> TrackId:
+    return TrackId(f"{track_num}.0")
+
+
+def read_scenes(_scene_locations, side1_tracks, side2_tracks, metrics: DecodeMetrics = None):
+    metrics = metrics or NULL_METRICS
+    with metrics.stage("scenes"):
+        all_scenes_data = _assemble_scenes(_scene_locations, side1_tracks, side2_tracks)
+    if metrics.enabled:
+        metrics.count("scenes_assembled", len(all_scenes_data))
+        metrics.count("scene_bytes", sum(len(scene_data) for scene_data in all_scenes_data.values()))
+    return all_scenes_data
+
+
+def get_scene_sectors(loc) -> list[tuple[int, int]]:
+    """(track, sector) of every sector of a scene, in order, wrapping from the last track to the first."""
+    track = loc.start_track
+    sector = loc.start_sector
+    sectors = []
+    while True:
+        sectors.append((track, sector))
+        if track == loc.end_track and sector == loc.end_sector:
+            return sectors
+        if sector == RapidlokTrackReader.compute_total_sectors(track):
+            track += 1
+            sector = 0
+        else:
+            sector += 1
+        if track == LAST_TRACK + 1:
+            track = FIRST_TRACK
+
+
+def _assemble_scenes(_scene_locations, side1_tracks, side2_tracks):
+    all_scenes_data: dict[str, bytearray] = {}
+    for scene_id, loc in _scene_locations.items():
+        side = _get_side_for_scene(scene_id, side1_tracks, side2_tracks)
+        payloads = []
+        for track, sector in get_scene_sectors(loc):
+            if track not in side or sector not in side[track]:
+                raise SectorNotFoundError(scene_id, get_side_number_for_scene(scene_id), track, sector)
+            payloads.append(side[track].get_payload(sector))
+        # One buffer per scene, sized up front. The first 2 bytes (the load address,
+        # which is always $9F7F) are skipped while copying rather than sliced off after.
+        skip = LOAD_ADDRESS_SIZE
+        scene_data = bytearray(max(0, sum(len(payload) for payload in payloads) - skip))
+        pos = 0
+        for payload in payloads:
+            if skip:
+                skipped = min(skip, len(payload))
+                payload = payload[skipped:]
+                skip -= skipped
+            scene_data[pos:pos + len(payload)] = payload
+            pos += len(payload)
+        all_scenes_data[scene_id] = scene_data
+    return all_scenes_data
+
+
+def _get_side_for_scene(scene_id: str, side1_tracks, side2_tracks):
+    return side1_tracks if scene_id in SIDE1_SCENES else side2_tracks
+
+
+def get_side_number_for_scene(scene_id: str) -> int:
+    return 1 if scene_id in SIDE1_SCENES else 2
+
+
+def plan_scene_reads(_scene_locations, scene_ids) -> dict[int, dict[int, set[int]]]:
+    """The sectors needed to assemble the given scenes, as {side number: {track: sectors}}."""
+    plan: dict[int, dict[int, set[int]]] = {1: {}, 2: {}}
+    for scene_id in scene_ids:
+        side_number = get_side_number_for_scene(scene_id)
+        excluded = SIDE1_EXCLUDED_TRACKS if side_number == 1 else SIDE2_EXCLUDED_TRACKS
+        for track, sector in get_scene_sectors(_scene_locations[scene_id]):
+            if track in excluded:
+                raise Exception("Scene %s uses track %d, which is not in Rapidlok format" % (scene_id, track))
+            plan[side_number].setdefault(track, set()).add(sector)
+    return plan
+
+
+def read_scenes_on_demand(_scene_locations, scene_ids, side_1: G64, side_2: G64, cache: DecodeCache = None,
+                          metrics: DecodeMetrics = None):
+    """Assemble only the given scenes, decoding only the tracks and sectors they use.
+
+    Whole tracks already in the cache are used as they are. Tracks decoded here hold only
+    the planned sectors, so they are never added to the cache.
+    """
+    metrics = metrics or NULL_METRICS
+    plan = plan_scene_reads(_scene_locations, scene_ids)
+    sides_tracks = []
+    for side_g64, side_plan in ((side_1, plan[1]), (side_2, plan[2])):
+        fingerprint = cache.fingerprint(side_g64) if cache and side_plan else None
+        side_tracks = {}
+        for track_num in sorted(side_plan):
+            track = cache.get_track(fingerprint, track_num) if cache else None
+            if track is None:
+                reader = RapidlokTrackReader(track_num, _get_raw_track(side_g64, track_num), metrics,
+                                             side_plan[track_num])
+                track = reader.get_track()
+            else:
+                metrics.count("cache_hits")
+            side_tracks[track_num] = track
+        sides_tracks.append(side_tracks)
+    return read_scenes({scene_id: _scene_locations[scene_id] for scene_id in scene_ids}, *sides_tracks, metrics)
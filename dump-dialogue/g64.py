@@ -1,26 +1,114 @@
+import mmap
+from collections import OrderedDict
+
 from common_helpers import *
-from disk_entities import TrackId
+from decode_metrics import NULL_METRICS
+from disk_entities import Track, TrackId
 from gcr_track_reader import GCRTrackReader
+from rapidlok_track_reader import RapidlokTrackReader
+
+DEFAULT_MAX_DECODED_TRACKS = 16
 
 
 class G64:
     TRACK_SIZE_HEADER = 2
     START_POSITION = 12
     OFFSET_SIZE = 4
-
-    def __init__(self, filename):
-        with open(filename, "rb") as file:
-            self.data = file.read()
-
-        self.filename = filename
-        self.validate_signature()
-        self.number_of_tracks = self.data[9]
-        self.track_size = self.read_word(10)
-        self.read_track_offsets()
-        self.read_tracks()
+    #What g64[track_id] returns: the raw track, or the track decoded by one of the readers
+    MODE_RAW = "raw"
+    MODE_GCR = "gcr"
+    MODE_RAPIDLOK = "rapidlok"
+
+    def __init__(self, filename, use_mmap=False, metrics=None, mode=MODE_RAW,
+                 max_decoded_tracks=DEFAULT_MAX_DECODED_TRACKS):
+        #With use_mmap, the image is memory-mapped and tracks become zero-copy
+        #memoryviews, sliced on first access instead of all up front.
+        #In GCR or Rapidlok mode a track is decoded on its first access, and the last
+        #max_decoded_tracks decoded tracks are kept. The raw tracks are never replaced.
+        self.metrics = metrics or NULL_METRICS
+        self.mode = mode
+        self.max_decoded_tracks = max_decoded_tracks
+        self.decoded_tracks: OrderedDict = OrderedDict()
+        with self.metrics.stage("g64_open"):
+            self.mapped_file = None
+            if use_mmap:
+                with open(filename, "rb") as file:
+                    self.mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = memoryview(self.mapped_file)
+            else:
+                with open(filename, "rb") as file:
+                    self.data = file.read()
+            self.metrics.count("image_bytes", len(self.data))
+
+            self.filename = filename
+            self.use_mmap = use_mmap
+            self.validate_signature()
+            self.number_of_tracks = self.data[9]
+            self.track_size = self.read_word(10)
+            self.read_track_offsets()
+            self.read_speed_zones()
+            if use_mmap:
+                self.tracks = {}
+            else:
+                self.read_tracks()
 
     def __getitem__(self, key):
-        return self.tracks[key]
+        if self.mode == self.MODE_RAW:
+            return self.get_raw_track(key)
+        return self.get_decoded_track(key)
+
+    def __contains__(self, key):
+        return self.track_offsets.get(key, 0) != 0
+
+    def get_raw_track(self, key):
+        track = self.tracks.get(key)
+        if track is None:
+            if not self.use_mmap:
+                raise KeyError(key)
+            track = self.read_track(key)
+            self.tracks[key] = track
+        return track
+
+    def get_decoded_track(self, key, mode=None) -> Track:
+        """The track decoded as GCR or Rapidlok (the image mode by default), KeyError if absent."""
+        mode = mode or self.mode
+        cache_key = (mode, key)
+        track = self.decoded_tracks.get(cache_key)
+        if track is not None:
+            self.decoded_tracks.move_to_end(cache_key)
+            self.metrics.count("track_lru_hits")
+            return track
+
+        raw_track = self.get_raw_track(key)
+        if mode == self.MODE_GCR:
+            track = GCRTrackReader(self.metrics).read_track(key.track_number, raw_track)
+        elif mode == self.MODE_RAPIDLOK:
+            track = RapidlokTrackReader(key.track_number, raw_track, self.metrics).get_track()
+        else:
+            raise Exception("Tracks can't be decoded in mode " + str(mode))
+
+        self.decoded_tracks[cache_key] = track
+        while len(self.decoded_tracks) > self.max_decoded_tracks:
+            self.decoded_tracks.popitem(last=False)
+        return track
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.decoded_tracks.clear()
+        if self.mapped_file is None:
+            return
+        #Views handed out by __getitem__ are released too, they can't outlive the mapping
+        for track in self.tracks.values():
+            track.release()
+        self.tracks = {}
+        self.data.release()
+        self.mapped_file.close()
+        self.mapped_file = None
 
     def __repr__(self):
         s = "G64 " + self.filename + " - Number of tracks: " + str(self.number_of_tracks)
@@ -48,36 +136,47 @@ class G64:
         track_id = TrackId.first()
 
         for i in range(0, self.number_of_tracks):
-            track_start = self.track_offsets[track_id]
-            track_end = track_start + self.track_size + self.TRACK_SIZE_HEADER
-
-            if track_start != 0:
-                self.tracks[track_id] = self.data[track_start:track_end]
+            if self.track_offsets[track_id] != 0:
+                self.tracks[track_id] = self.read_track(track_id)
 
             if track_id.is_last():
                 break
             track_id = track_id.next()
 
+    def read_track(self, track_id):
+        track_start = self.track_offsets.get(track_id, 0)
+        if track_start == 0:
+            raise KeyError(track_id)
+        track_end = track_start + self.track_size + self.TRACK_SIZE_HEADER
+        return self.data[track_start:track_end]
+
     def decode_tracks_as_gcr(self):
-        reader = GCRTrackReader()
+        #Tracks are no longer decoded up front: g64[track_id] now decodes them on first access
+        self.mode = self.MODE_GCR
+
+    def read_track_offsets(self):
 
+        self.track_offsets = {}
         track_id = TrackId.first()
 
         for i in range(0, self.number_of_tracks):
-            self.tracks[track_id] = reader.read_track(track_id.track_number, self.tracks[track_id])
+            offset_position = self.START_POSITION + i * self.OFFSET_SIZE
+            self.track_offsets[track_id] = self.read_dword(offset_position)
 
             if track_id.is_last():
                 break
             track_id = track_id.next()
 
-    def read_track_offsets(self):
-
-        self.track_offsets = {}
+    def read_speed_zones(self):
+        #The speed zone table follows the track offset table, one dword per track.
+        #Values 0-3 are the zone of the whole track, anything else is an offset to per-byte zones.
+        self.speed_zones = {}
         track_id = TrackId.first()
+        table_start = self.START_POSITION + self.number_of_tracks * self.OFFSET_SIZE
 
         for i in range(0, self.number_of_tracks):
-            offset_position = self.START_POSITION + i * self.OFFSET_SIZE
-            self.track_offsets[track_id] = self.read_dword(offset_position)
+            offset_position = table_start + i * self.OFFSET_SIZE
+            self.speed_zones[track_id] = self.read_dword(offset_position)
 
             if track_id.is_last():
                 break
@@ -0,0 +1,94 @@
+from disk_entities import TrackId
+from g64 import G64
+
+G64_SIGNATURE = b"GCR-1541"
+G64_VERSION = 0
+DEFAULT_NUMBER_OF_TRACKS = 84
+DEFAULT_TRACK_SIZE = 7928
+DEFAULT_SPEED_ZONE = 3
+MAX_SPEED_ZONE = 3
+
+
+def pack_track(track_bytes: bytes, track_size=DEFAULT_TRACK_SIZE) -> bytes:
+    """A track the way G64 returns it: 2-byte size, the track bytes and padding up to the track size."""
+    if len(track_bytes) > track_size:
+        raise Exception("Track of %d bytes is longer than the track size" % len(track_bytes))
+    return len(track_bytes).to_bytes(G64.TRACK_SIZE_HEADER, "little") + bytes(track_bytes) + bytes(track_size - len(track_bytes))
+
+
+class G64Writer:
+    """Builds G64 images, the inverse of G64.read_track_offsets, read_speed_zones and read_tracks.
+
+    Tracks are laid out back to back after the two tables, in track order, each one as
+    its 2-byte size, the track bytes and padding up to the track size. An image written
+    this way is read back by G64 with the same tracks and speed zones, and from_g64 of
+    such an image writes it out again byte for byte.
+    """
+
+    def __init__(self, number_of_tracks=DEFAULT_NUMBER_OF_TRACKS, track_size=DEFAULT_TRACK_SIZE, version=G64_VERSION):
+        self.number_of_tracks = number_of_tracks
+        self.track_size = track_size
+        self.version = version
+        self.tracks: dict[TrackId, bytes] = {}
+        self.speed_zones: dict[TrackId, int] = {}
+
+    @classmethod
+    def from_g64(cls, g64: G64):
+        """A writer holding every track of an opened image, to patch some and write it out again."""
+        writer = cls(g64.number_of_tracks, g64.track_size, g64.data[8])
+        for track_id, offset in g64.track_offsets.items():
+            if offset == 0:
+                continue
+            speed_zone = g64.speed_zones.get(track_id, DEFAULT_SPEED_ZONE)
+            if speed_zone > MAX_SPEED_ZONE:
+                raise Exception("Track %s has per-byte speed zones, which can't be written" % track_id)
+            writer.set_g64_track(track_id, bytes(g64.get_raw_track(track_id)), speed_zone)
+        return writer
+
+    def set_track(self, track_id: TrackId, track_bytes: bytes, speed_zone=DEFAULT_SPEED_ZONE):
+        """Store the bytes of a track, adding the size and the padding of the G64 format."""
+        self.set_g64_track(track_id, pack_track(track_bytes, self.track_size), speed_zone)
+
+    def set_g64_track(self, track_id: TrackId, g64_track: bytes, speed_zone=DEFAULT_SPEED_ZONE):
+        """Store a track as G64 returns it, size and padding included."""
+        if len(g64_track) != self.track_size + G64.TRACK_SIZE_HEADER:
+            raise Exception("Track %s doesn't match the track size" % track_id)
+        self.tracks[track_id] = bytes(g64_track)
+        self.speed_zones[track_id] = speed_zone
+
+    def remove_track(self, track_id: TrackId):
+        self.tracks.pop(track_id, None)
+        self.speed_zones.pop(track_id, None)
+
+    def get_track_ids(self) -> list[TrackId]:
+        track_ids = []
+        track_id = TrackId.first()
+        for i in range(0, self.number_of_tracks):
+            track_ids.append(track_id)
+            if track_id.is_last():
+                break
+            track_id = track_id.next()
+        return track_ids
+
+    def to_bytes(self) -> bytes:
+        track_ids = self.get_track_ids()
+        offset = G64.START_POSITION + len(track_ids) * G64.OFFSET_SIZE * 2
+        offsets = []
+        speed_zones = []
+        for track_id in track_ids:
+            track = self.tracks.get(track_id)
+            offsets.append(offset if track is not None else 0)
+            speed_zones.append(self.speed_zones[track_id] if track is not None else 0)
+            if track is not None:
+                offset += len(track)
+
+        parts = [G64_SIGNATURE, bytes([self.version, self.number_of_tracks]),
+                 self.track_size.to_bytes(2, "little")]
+        parts += [value.to_bytes(G64.OFFSET_SIZE, "little") for value in offsets]
+        parts += [value.to_bytes(G64.OFFSET_SIZE, "little") for value in speed_zones]
+        parts += [self.tracks[track_id] for track_id in track_ids if track_id in self.tracks]
+        return b"".join(parts)
+
+    def save(self, filename):
+        with open(filename, "wb") as file:
+            file.write(self.to_bytes())
@@ -0,0 +1,75 @@
+# The final score, as game_over computes it ($5816-$588e in 11-computer-main-code.txt).
+# Metrics are in zero page order, $7e-$84.
+
+METRIC_NAMES = ("authority", "crooks_captured", "romance", "lawful_kills", "times_injured", "unlawful_kills",
+                "crimes_committed")
+AUTHORITY, CROOKS_CAPTURED, ROMANCE, LAWFUL_KILLS, TIMES_INJURED, UNLAWFUL_KILLS, CRIMES_COMMITTED = range(7)
+POSITIVE_METRICS = (AUTHORITY, CROOKS_CAPTURED, ROMANCE, LAWFUL_KILLS)
+NEGATIVE_METRICS = (TIMES_INJURED, UNLAWFUL_KILLS, CRIMES_COMMITTED)
+METRIC_CAP = 12
+AUTHORITY_DIVISOR = 11
+# crimes_committed starts at 6 and each Dalton gang member killed takes one off
+ROBBERIES = 6
+# Added running total times in decimal mode, the carry out of the high byte is lost
+SCORE_STEP_BCD = 0x0285
+
+
+def scale_authority(authority: int) -> int:
+    # ASL, then SBC #$0B until it borrows
+    return ((authority << 1) & 0xFF) // AUTHORITY_DIVISOR
+
+
+def cap_metrics(metrics) -> list[int]:
+    return [value if value < METRIC_CAP + 1 else METRIC_CAP for value in metrics]
+
+
+def get_final_metrics(metrics) -> list[int]:
+    """The 7 metrics as game_over shows them: authority scaled, then everything capped at 12."""
+    metrics = list(metrics)
+    metrics[AUTHORITY] = scale_authority(metrics[AUTHORITY])
+    return cap_metrics(metrics)
+
+
+def get_running_total(final_metrics) -> int:
+    """Positive metrics minus the negative ones, 0 if any subtraction borrows."""
+    total = sum(final_metrics[i] for i in POSITIVE_METRICS) & 0xFF
+    for i in NEGATIVE_METRICS:
+        total -= final_metrics[i]
+        if total < 0:
+            return 0
+    return total
+
+
+def bcd_add_16(a: int, b: int) -> int:
+    # SED, ADC on the low then the high byte: 4 BCD digits, carry out of the top digit dropped
+    result = 0
+    carry = 0
+    for shift in range(0, 16, 4):
+        digit = ((a >> shift) & 0xF) + ((b >> shift) & 0xF) + carry
+        carry = 1 if digit > 9 else 0
+        result |= (digit - 10 if carry else digit) << shift
+    return result
+
+
+def bcd_to_int(value: int) -> int:
+    return int(f"{value:04x}")
+
+
+def get_score_bcd(total: int) -> int:
+    score = 0
+    for i in range(total):
+        score = bcd_add_16(score, SCORE_STEP_BCD)
+    return score
+
+
+def compute_score(metrics, low_digits: int = 0) -> int:
+    """Final score of raw metrics (authority unscaled, crimes_committed after the gang kills).
+
+    The game overwrites the last 2 digits with 2 nibbles of random_score_nibbles ($534e), a
+    table not in the disassembly: low_digits stands for them, 0 gives the score in hundreds.
+    """
+    return get_score_for_total(get_running_total(get_final_metrics(metrics))) + low_digits
+
+
+def get_score_for_total(total: int) -> int:
+    return bcd_to_int(get_score_bcd(total)) // 100 * 100
@@ -0,0 +1,51 @@
+from gcr_decoder import DECODED_GROUP_SIZE, GCR_GROUP_SIZE, GCR_NIBBLES, GCR_PAIR_BITS
+
+#4-bit nibble -> 5-bit GCR code, the inverse of GCR_NIBBLES
+GCR_CODES = {nibble: code for code, nibble in GCR_NIBBLES.items()}
+
+
+def build_gcr_encode_tables():
+    #Byte n of a group is encoded as the 10-bit pair at bits 30 - 10n.. of the 40-bit GCR group,
+    #which lands in at most two of its 5 bytes. For every (GCR byte, group byte) pair this is
+    #a translate table of the bits that group byte contributes to that GCR byte.
+    #Returns, for each GCR byte, a list of (group byte index, table).
+    group_bits = GCR_GROUP_SIZE * 8
+    tables = []
+    for gcr_index in range(GCR_GROUP_SIZE):
+        gcr_shift = group_bits - 8 - gcr_index * 8
+        contributions = []
+        for byte_index in range(DECODED_GROUP_SIZE):
+            pair_shift = group_bits - GCR_PAIR_BITS - byte_index * GCR_PAIR_BITS
+            table = bytes((((GCR_CODES[b >> 4] << 5 | GCR_CODES[b & 0x0F]) << pair_shift) >> gcr_shift) & 0xFF
+                          for b in range(256))
+            if any(table):
+                contributions.append((byte_index, table))
+        tables.append(contributions)
+    return tuple(tables)
+
+
+GCR_ENCODE_TABLES = build_gcr_encode_tables()
+
+
+class GCREncoder:
+    @staticmethod
+    def encode_gcr_bytes(data) -> bytes:
+        """Encode a whole buffer (bytes, bytearray or memoryview), 4 bytes to 5 GCR bytes.
+
+        GCRDecoder.decode_gcr_buffer gives back data, with no errors.
+        """
+        if len(data) % DECODED_GROUP_SIZE != 0:
+            raise Exception("Data bytes not multiple of 4")
+
+        #Same idea as the triple decoding of Rapidlok sectors: split the groups into one stream
+        #per byte position, translate whole streams and OR them together as big integers
+        data = bytes(data)
+        count = len(data) // DECODED_GROUP_SIZE
+        streams = [data[i::DECODED_GROUP_SIZE] for i in range(DECODED_GROUP_SIZE)]
+        encoded = bytearray(count * GCR_GROUP_SIZE)
+        for gcr_index, contributions in enumerate(GCR_ENCODE_TABLES):
+            value = 0
+            for byte_index, table in contributions:
+                value |= int.from_bytes(streams[byte_index].translate(table), "big")
+            encoded[gcr_index::GCR_GROUP_SIZE] = value.to_bytes(count, "big")
+        return bytes(encoded)
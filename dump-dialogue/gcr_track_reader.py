@@ -1,21 +1,83 @@
+from functools import reduce
+from operator import xor
+
+from decode_metrics import NULL_METRICS
 from disk_entities import Sector, SectorHeader, Track, get_sectors_per_track
 from gcr_decoder import GCRDecoder
 
 
+class GCRSectorLocation:
+    def __init__(self, sector_number, header_offset, data_offset):
+        #Bit offsets of the header and data blocks, right after their syncs.
+        #Blocks read past the track index keep their unwrapped offset (>= track bits).
+        self.sector_number = sector_number
+        self.header_offset = header_offset
+        self.data_offset = data_offset
+
+    def __repr__(self):
+        return "Sector " + str(self.sector_number) + " header at bit " + str(self.header_offset) + " data at bit " + str(self.data_offset)
+
+
 class GCRTrackReader:
     HEADER_INFO_SIZE = 10
     GCR_PAYLOAD_SIZE = 325
+    SYNC_MIN_BITS = 10
+    TRACK_SIZE_HEADER = 2
+    GCR_GROUP_SIZE = 5
+    HEADER_BLOCK_ID = 0x08
+    DATA_BLOCK_ID = 0x07
 
-    def __init__(self):
-        pass
+    def __init__(self, metrics=None):
+        self.metrics = metrics or NULL_METRICS
 
     def read_track(self, track_number, data):
+        with self.metrics.stage("gcr_track"):
+            return self.read_track_data(track_number, data)
+
+    def read_track_data(self, track_number, data):
         self.data = data
         self.actual_size = self.read_track_actual_size()
         #Remove header after reading it (track size)
-        data = data[2:]
+        data = data[self.TRACK_SIZE_HEADER:]
+        track_bytes = bytes(data[:self.actual_size]) if 0 < self.actual_size <= len(data) else bytes(data)
+        self.track_bits = len(track_bytes) * 8
+        #The track is circular: scan two back to back copies so that syncs and
+        #sectors straddling the track index are read in one piece
+        self.load_bitstream(track_bytes * 2)
         self.bit_position = 0
-        return Track(track_number, self.get_sectors(track_number), data)
+        self.sector_map = self.build_sector_map()
+        payloads, headers = self.get_sectors(track_number)
+        if self.metrics.enabled:
+            self.count_track_metrics(track_number)
+        #The raw track stays with whoever passed it in (G64 keeps its own)
+        return Track.from_sectors(track_number, payloads, headers)
+
+    def count_track_metrics(self, track_number):
+        metrics = self.metrics
+        metrics.count("tracks_decoded")
+        metrics.count("bytes_scanned", self.track_bits // 8)
+        metrics.count("bits_scanned", self.track_bits)
+        #A run starts where a sync start has no sync start right before it. Only the first copy counts.
+        run_starts = (self.sync_starts & ~(self.sync_starts >> 1)) >> (self.total_bits - self.track_bits)
+        metrics.count("sync_runs", bin(run_starts).count("1"))
+        metrics.count("headers_found", len(self.sector_map))
+        metrics.count("headers_missing", max(0, get_sectors_per_track(track_number) + 1 - len(self.sector_map)))
+
+    def load_bitstream(self, data):
+        #The whole track as one big integer, first track bit being the most significant one
+        self.bitstream = int.from_bytes(data, "big")
+        self.total_bits = len(data) * 8
+        self.zero_bits = self.bitstream ^ ((1 << self.total_bits) - 1)
+        self.sync_starts = self.find_sync_starts(self.bitstream)
+
+    @classmethod
+    def find_sync_starts(cls, bitstream):
+        #Set a bit wherever SYNC_MIN_BITS consecutive 1 bits start (towards the less significant end).
+        #Runs are doubled up (2, 4, 8 bits) and then extended to 10 instead of ANDing 10 shifted copies.
+        runs_2 = bitstream & (bitstream << 1)
+        runs_4 = runs_2 & (runs_2 << 2)
+        runs_8 = runs_4 & (runs_4 << 4)
+        return runs_8 & (runs_2 << (cls.SYNC_MIN_BITS - 2))
 
     def read_track_actual_size(self):
         return self.read_word(0)
@@ -23,49 +85,103 @@ class GCRTrackReader:
     def read_word(self, i):
         return self.data[i] + (self.data[i+1] << 8)
 
-    def get_sectors(self, track_number):
-        track_sectors = {}
-        sector_count = 0
-        while sector_count < get_sectors_per_track(track_number) + 1:
-            sector = self.read_sector()
-            if not sector:
-                #print("could not find sector header for track %d sector %d" % (track_number, sector_count))
-                pass
-            track_sectors[sector_count] = sector
-            sector_count += 1
-        return track_sectors
-
-    def read_sector(self):
+    def build_sector_map(self):
+        #Single pass over the track: pair every valid header with the data block that follows it
+        sector_map: dict[int, GCRSectorLocation] = {}
+        pending_header = None
+        first_block_offset = None
+        self.bit_position = 0
+
+        while True:
+            try:
+                self.find_sync_end()
+            except IndexError:
+                break
+            block_offset = self.bit_position
+
+            #Stop once back at the first block: the second copy is only there for wraparound.
+            #Blocks before it in the first copy may have had their sync cut by the track index.
+            if first_block_offset is None:
+                first_block_offset = block_offset
+            elif block_offset >= self.track_bits + first_block_offset and pending_header is None:
+                break
+
+            block_id = self.peek_block_id()
+            if block_id == self.HEADER_BLOCK_ID:
+                pending_header = self.read_header_sector_number()
+                if pending_header is not None:
+                    pending_header = (pending_header, block_offset)
+            elif block_id == self.DATA_BLOCK_ID and pending_header is not None:
+                sector_number, header_offset = pending_header
+                if sector_number not in sector_map:
+                    sector_map[sector_number] = GCRSectorLocation(sector_number, header_offset, block_offset)
+                pending_header = None
+                self.bit_position += self.GCR_PAYLOAD_SIZE * 8
+            else:
+                pending_header = None
+
+        return sector_map
+
+    def peek_block_id(self):
+        if self.bit_position + self.GCR_GROUP_SIZE * 8 > self.total_bits:
+            return None
+        decoded_group, errors = GCRDecoder.decode_gcr_buffer(self.peek_bytes(self.GCR_GROUP_SIZE))
+        return None if errors & 1 else decoded_group[0]
+
+    def read_header_sector_number(self):
         try:
-            self.find_sync_end()
             header_info = self.get_header_info_2()
-            header = SectorHeader(header_info)
-            self.find_sync_end()
-        except:
+        except IndexError:
+            return None
+        header_bytes, errors = GCRDecoder.decode_gcr_buffer(header_info)
+        if errors:
+            self.metrics.count("gcr_errors", bin(errors).count("1"))
+            return None
+        return SectorHeader(header_info).sector
+
+    def get_sectors(self, track_number):
+        #{sector: payload} and {sector: header}, joined into one buffer by Track.from_sectors
+        payloads = {}
+        headers = {}
+        for sector_number in sorted(self.sector_map):
+            sector = self.read_sector_at(self.sector_map[sector_number])
+            payloads[sector_number] = sector.data
+            headers[sector_number] = sector.header
+        return payloads, headers
+
+    def get_sector(self, sector_number):
+        location = self.sector_map.get(sector_number)
+        if location is None:
             return None
+        return self.read_sector_at(location)
+
+    def read_sector_at(self, location):
+        self.bit_position = location.header_offset
+        header = SectorHeader(self.get_header_info_2())
+        self.bit_position = location.data_offset
         gcr_data = self.get_gcr_sector_data()
         sector_data = self.decode_sector_data(gcr_data)
-        sector = Sector(header, sector_data)
-        return sector
+        return Sector(header, sector_data)
 
     def find_sync_end(self):
-        run_count = 0
-        run_observed = False
-        minimum_count = 10
-
-        while True:
-            bit = self.get_next_bit()
-            if bit == 1:
-                run_count += 1
-            else:
-                if run_observed:
-                    self.bit_position -= 1
-                    return
-                else:
-                    run_count = 0
-
-            if run_count == minimum_count:
-                run_observed = True
+        #A sync is a run of at least SYNC_MIN_BITS 1 bits starting at or after bit_position.
+        #The data that follows starts at the first 0 bit after that run.
+        remaining_bits = self.total_bits - self.bit_position
+        if remaining_bits <= 0:
+            raise IndexError("no sync found before end of track")
+
+        #Bit i of the bitstream is track bit total_bits - 1 - i, so keeping the
+        #lowest remaining_bits bits keeps track bits from bit_position onwards
+        sync_starts = self.sync_starts & ((1 << remaining_bits) - 1)
+        if not sync_starts:
+            raise IndexError("no sync found before end of track")
+        sync_start = self.total_bits - sync_starts.bit_length()
+
+        remaining_bits = self.total_bits - sync_start - self.SYNC_MIN_BITS
+        zero_bits = self.zero_bits & ((1 << remaining_bits) - 1) if remaining_bits > 0 else 0
+        if not zero_bits:
+            raise IndexError("sync runs up to the end of track")
+        self.bit_position = self.total_bits - zero_bits.bit_length()
 
     def get_header_info_2(self):
         return self.get_bytes(self.HEADER_INFO_SIZE)
@@ -74,31 +190,42 @@ class GCRTrackReader:
         return self.get_bytes(self.GCR_PAYLOAD_SIZE)
 
     def get_next_bit(self):
-        byte_position = self.bit_position >> 3
-        bit_index = 7 - (self.bit_position % 8)
-        bitmask = 1 << bit_index
-        byte = self.data[byte_position]
+        if self.bit_position >= self.total_bits:
+            raise IndexError("bit position past end of track")
+        bit = (self.bitstream >> (self.total_bits - 1 - self.bit_position)) & 1
         self.bit_position += 1
-        return (byte & bitmask) >> bit_index
+        return bit
 
     def get_byte(self):
-        byte = 0
-        for i in range(0, 8):
-            byte <<= 1
-            bit = self.get_next_bit()
-            byte |= bit
-        return byte
+        return self.get_bytes(1)[0]
+
+    def peek_bytes(self, length):
+        bytes_read = self.get_bytes(length)
+        self.bit_position -= length * 8
+        return bytes_read
 
     def get_bytes(self, length):
-        _bytes = []
-        for i in range(0, length):
-            _bytes.append(self.get_byte())
-        return _bytes
+        #Read length bytes starting at an arbitrary bit offset with a single shift
+        bit_count = length * 8
+        shift = self.total_bits - self.bit_position - bit_count
+        if shift < 0:
+            raise IndexError("read past end of track")
+        value = (self.bitstream >> shift) & ((1 << bit_count) - 1)
+        self.bit_position += bit_count
+        return value.to_bytes(length, "big")
 
     def decode_sector_data(self, sector_data):
-        decoded_bytes = GCRDecoder.decode_gcr_bytes(sector_data)
+        decoded_bytes, errors = GCRDecoder.decode_gcr_buffer(sector_data)
+        if errors:
+            self.metrics.count("gcr_errors", bin(errors).count("1"))
         block_id = decoded_bytes[0]
         payload = decoded_bytes[1:257]
         checksum = decoded_bytes[257]
+        if self.metrics.enabled:
+            #The checksum is the XOR of the 256 payload bytes
+            if errors or checksum != reduce(xor, payload, 0):
+                self.metrics.count("sectors_bad_data")
+            else:
+                self.metrics.count("sectors_decoded")
         return payload
 
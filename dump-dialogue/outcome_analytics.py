@@ -0,0 +1,210 @@
+import argparse
+import json
+from collections import Counter
+
+from dialogue import (DOCTOR_SCENE, WOMAN_SCENES, get_authority_for_final_line_man, get_authority_for_final_line_woman,
+                      get_outcome_offset, get_romance_for_final_line)
+from dialogue_index import DOCTOR_STATES, PATHS_PER_SCENE, DialogueIndex, get_selections_for_path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Metrics of every path as byte matrices: one 64-byte row per scene, column i holding the path
+# whose selections have outcome offset i, i.e. row[get_outcome_offset(selections)] is what
+# get_outcome_from_selections returns. Each metric is one translate of the outcome bytes
+# through a 256-entry table, and queries are translate/count/find over whole rows.
+
+NOT_APPLICABLE = 0xFF
+NPC_STATE_MASK = 0x1F
+SURRENDER_STATES = (4, 5)
+METRICS = ("outcome", "authority", "romance", "doctor_state", "npc_state")
+
+
+def build_metric_tables():
+    return {
+        "outcome": bytes(range(256)),
+        "authority_man": bytes(get_authority_for_final_line_man(o) for o in range(256)),
+        "authority_woman": bytes(get_authority_for_final_line_woman(o) for o in range(256)),
+        "romance": bytes(get_romance_for_final_line(o) for o in range(256)),
+        "doctor_state": bytes(DOCTOR_STATES[o >> 5] for o in range(256)),
+        "npc_state": bytes(o & NPC_STATE_MASK for o in range(256)),
+        "not_applicable": bytes([NOT_APPLICABLE]) * 256,
+    }
+
+
+METRIC_TABLES = build_metric_tables()
+
+
+def get_metric_table(metric, scene_number) -> bytes:
+    if metric == "authority":
+        return METRIC_TABLES["authority_woman" if scene_number in WOMAN_SCENES else "authority_man"]
+    if metric == "romance" and scene_number not in WOMAN_SCENES:
+        return METRIC_TABLES["not_applicable"]
+    if metric == "doctor_state" and scene_number != DOCTOR_SCENE:
+        return METRIC_TABLES["not_applicable"]
+    return METRIC_TABLES[metric]
+
+
+def build_match_table(values) -> bytes:
+    # "1" for the metric values a query accepts, "0" for the rest: a translated row is
+    # the binary digits of a 64-bit mask, read with int(row, 2)
+    if isinstance(values, int):
+        values = (values,)
+    accepted = set(values)
+    return bytes(ord("1") if v in accepted else ord("0") for v in range(256))
+
+
+def find_all(row: bytes, value: int) -> list[int]:
+    positions = []
+    pos = row.find(value)
+    while pos != -1:
+        positions.append(pos)
+        pos = row.find(value, pos + 1)
+    return positions
+
+
+class OutcomeAnalytics:
+    """Outcomes of every scene turned into metric matrices, with aggregate queries over them.
+
+    Scenes without a metric (romance outside the woman scenes, the doctor state outside
+    scene 4) hold NOT_APPLICABLE, which queries leave out.
+    """
+
+    def __init__(self, scenes_outcomes):
+        # scenes_outcomes: {scene number: the 64 outcome bytes}
+        self.scene_numbers = sorted(scenes_outcomes)
+        self.rows = {metric: {} for metric in METRICS}
+        for scene_number in self.scene_numbers:
+            outcomes = bytes(scenes_outcomes[scene_number][:PATHS_PER_SCENE])
+            for metric in METRICS:
+                self.rows[metric][scene_number] = outcomes.translate(get_metric_table(metric, scene_number))
+
+    @classmethod
+    def from_scenes_data(cls, _scenes_data):
+        return cls({int(scene_id): scene_data[:PATHS_PER_SCENE] for scene_id, scene_data in _scenes_data.items()})
+
+    @classmethod
+    def from_index(cls, index: DialogueIndex):
+        return cls({scene_number: scene.outcomes for scene_number, scene in index.scenes.items()})
+
+    def get_row(self, metric, scene_number) -> bytes:
+        return self.rows[metric][scene_number]
+
+    def get_value(self, metric, scene_number, selections) -> int:
+        return self.rows[metric][scene_number][get_outcome_offset(selections)]
+
+    def get_matrix(self, metric) -> bytes:
+        """The rows of every scene back to back, in scene_numbers order."""
+        return b"".join(self.rows[metric][n] for n in self.scene_numbers)
+
+    def to_numpy(self, metric):
+        """The metric as a (scenes, 64) uint8 array. Needs NumPy."""
+        if numpy is None:
+            raise Exception("NumPy is not installed")
+        return numpy.frombuffer(self.get_matrix(metric), numpy.uint8).reshape(len(self.scene_numbers), PATHS_PER_SCENE)
+
+    def distribution(self, metric, scene_number) -> dict[int, int]:
+        """{value: number of paths} of one scene, NOT_APPLICABLE left out."""
+        counts = Counter(self.rows[metric][scene_number])
+        counts.pop(NOT_APPLICABLE, None)
+        return dict(sorted(counts.items()))
+
+    def distributions(self, metric) -> dict[int, dict[int, int]]:
+        return {n: self.distribution(metric, n) for n in self.scene_numbers if self.applies(metric, n)}
+
+    def applies(self, metric, scene_number) -> bool:
+        return self.rows[metric][scene_number][0] != NOT_APPLICABLE
+
+    def count_paths(self, scene_number=None, **conditions) -> int:
+        """Number of paths matching every condition, e.g. count_paths(npc_state=SURRENDER_STATES)."""
+        return sum(bin(mask).count("1") for n, mask in self.match(scene_number, **conditions))
+
+    def find_paths(self, scene_number=None, **conditions) -> list[tuple[int, tuple[int, int, int]]]:
+        """(scene, selections) of the paths matching every condition, each a value or a collection of values."""
+        paths = []
+        for n, mask in self.match(scene_number, **conditions):
+            # Bit 63 - i of the mask is path i
+            while mask:
+                top = mask.bit_length() - 1
+                paths.append((n, get_selections_for_path(PATHS_PER_SCENE - 1 - top)))
+                mask ^= 1 << top
+        return paths
+
+    def match(self, scene_number=None, **conditions):
+        # One 64-bit mask per scene, path i at bit 63 - i, ANDed over the conditions
+        scene_numbers = self.scene_numbers if scene_number is None else [scene_number]
+        tables = {metric: build_match_table(values) for metric, values in conditions.items()}
+        for n in scene_numbers:
+            mask = (1 << PATHS_PER_SCENE) - 1
+            for metric, table in tables.items():
+                mask &= int(self.rows[metric][n].translate(table), 2)
+            yield n, mask
+
+    def best_paths(self, metric, scene_number) -> tuple[int, list[tuple[int, int, int]]]:
+        """The highest value of a metric in a scene and the selections reaching it."""
+        row = self.rows[metric][scene_number]
+        best = max(row)
+        return best, [get_selections_for_path(i) for i in find_all(row, best)]
+
+    def best_paths_by_scene(self, metric) -> dict[int, tuple[int, list[tuple[int, int, int]]]]:
+        return {n: self.best_paths(metric, n) for n in self.scene_numbers if self.applies(metric, n)}
+
+    def max_romance_selections(self) -> dict[int, tuple[int, list[tuple[int, int, int]]]]:
+        return self.best_paths_by_scene("romance")
+
+    def surrender_counts(self) -> dict[int, int]:
+        return {n: sum(self.rows["npc_state"][n].count(state) for state in SURRENDER_STATES)
+                for n in self.scene_numbers}
+
+    def summary(self) -> dict:
+        return {
+            "authority": self.distributions("authority"),
+            "romance": self.distributions("romance"),
+            "doctor_state": self.distributions("doctor_state"),
+            "max_romance": {n: {"romance": best, "selections": selections}
+                            for n, (best, selections) in self.max_romance_selections().items()},
+            "max_authority": {n: {"authority": best, "selections": selections}
+                              for n, (best, selections) in self.best_paths_by_scene("authority").items()},
+            "surrender_paths": self.surrender_counts(),
+        }
+
+
+def format_summary(summary) -> str:
+    lines = []
+    for title, key in (("Authority", "authority"), ("Romance", "romance"), ("Doctor state", "doctor_state")):
+        lines.append(f"{title} distribution (value: paths)")
+        for scene_number, counts in summary[key].items():
+            lines.append(f"  Scene {scene_number:>2}: " + ", ".join(f"{v}: {c}" for v, c in counts.items()))
+    lines.append("Best romance")
+    for scene_number, best in summary["max_romance"].items():
+        lines.append(f"  Scene {scene_number:>2}: {best['romance']} with {len(best['selections'])} paths, "
+                     + " ".join("".join(map(str, s)) for s in best["selections"]))
+    lines.append("Paths ending in a surrender")
+    for scene_number, count in summary["surrender_paths"].items():
+        lines.append(f"  Scene {scene_number:>2}: {count}")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate the outcomes of every dialogue path")
+    parser.add_argument("--index", help="read the outcomes from a dialogue index saved by law-west-decoder --index "
+                                        "instead of decoding side1.g64 and side2.g64")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    if args.index:
+        analytics = OutcomeAnalytics.from_index(DialogueIndex.load(args.index))
+    else:
+        from disk_reader import SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, read_scenes_for_sides
+        from g64 import G64
+        from scene_location import SCENE_LOCATIONS
+        with G64("side1.g64", use_mmap=True) as side_1, G64("side2.g64", use_mmap=True) as side_2:
+            analytics = OutcomeAnalytics.from_scenes_data(read_scenes_for_sides(
+                SCENE_LOCATIONS, [(side_1, SIDE1_EXCLUDED_TRACKS), (side_2, SIDE2_EXCLUDED_TRACKS)]))
+    summary = analytics.summary()
+    if args.json:
+        print(json.dumps(summary, indent=1))
+    else:
+        print(format_summary(summary), end="")
@@ -0,0 +1,187 @@
+from disk_entities import TrackId
+from tracing import get_tracer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Whole-buffer versions of the Rapidlok loader decryptors (see 02-computer-first_decryptor.txt,
+# 03-computer-second_decryptor.txt and 06-drive-job_completed_decryptor.txt). Every stage is
+# an XOR between memory regions, so a stage run over many images joins the regions of all of
+# them and does a single XOR, instead of stepping byte by byte like the 6502 loops.
+
+TRACER = get_tracer("rapidlok_decryptor")
+# Below this many bytes, int.from_bytes beats the cost of going through NumPy arrays
+NUMPY_MIN_BYTES = 4096
+
+# Stage 1 loads the loader file at $02ED up to the RUN/STOP vector at $0328/$0329
+COMPUTER_MEMORY_BASE = 0x0200
+COMPUTER_MEMORY_SIZE = 0x0200
+LOADER_VECTOR_END = 0x032A
+# Stage 2: (encrypted_data),Y at $022A,Y XOR (xor_data),Y at $0200,Y for Y = $ED..$FF
+STAGE2_DATA = 0x0317
+STAGE2_KEY = 0x02ED
+STAGE2_LENGTH = 0x13
+# Stage 3: Y = $58 down to 0, first byte of each pair to $02B6,Y, first XOR second to $0200,Y
+STAGE3_PAIRS = 0x59
+STAGE3_DATA = 0x02B6
+STAGE3_DATA_2 = 0x0200
+# Stage 6, in the drive: buffer 0 (track 18 sector 15) XOR buffer 4 (track 18 sector 3)
+DRIVE_MEMORY_SIZE = 0x0800
+JOB_TRACK = 18
+JOB_SECTOR_DATA = 15
+JOB_SECTOR_KEY = 3
+BUFFER_0 = 0x0300
+BUFFER_4 = 0x0700
+BUFFER_SIZE = 0x100
+
+
+def xor_bytes(data: bytes, key: bytes) -> bytes:
+    """data XOR key, byte by byte, both the same length."""
+    if len(data) != len(key):
+        raise Exception("XOR of %d bytes with a key of %d bytes" % (len(data), len(key)))
+    if numpy is not None and len(data) >= NUMPY_MIN_BYTES:
+        return numpy.bitwise_xor(numpy.frombuffer(data, numpy.uint8), numpy.frombuffer(key, numpy.uint8)).tobytes()
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(len(data), "big")
+
+
+def xor_repeated_key(data: bytes, key: bytes) -> bytes:
+    """data XOR key repeated over its whole length."""
+    repeats = -(-len(data) // len(key))
+    return xor_bytes(data, (bytes(key) * repeats)[:len(data)])
+
+
+class LoaderMemory:
+    """The memory a loader stage works on: a bytearray mapped at base, and for the computer
+    side the loader bytes still waiting on the serial bus."""
+
+    def __init__(self, base, size, stream=b""):
+        self.base = base
+        self.data = bytearray(size)
+        self.stream = bytes(stream)
+
+    def read(self, address, length) -> bytes:
+        offset = address - self.base
+        if offset < 0 or offset + length > len(self.data):
+            raise Exception("$%04x-$%04x is outside the memory" % (address, address + length - 1))
+        return bytes(self.data[offset:offset + length])
+
+    def write(self, address, values):
+        offset = address - self.base
+        if offset < 0 or offset + len(values) > len(self.data):
+            raise Exception("$%04x-$%04x is outside the memory" % (address, address + len(values) - 1))
+        self.data[offset:offset + len(values)] = values
+
+    @classmethod
+    def from_loader_file(cls, file_data: bytes):
+        """Computer memory after stage 1: file_data starts with its load address ($02ED), and is
+        loaded up to the RUN/STOP vector. The rest is what stage 3 reads from the serial bus."""
+        load_address = file_data[0] | (file_data[1] << 8)
+        loaded_size = LOADER_VECTOR_END - load_address
+        memory = cls(COMPUTER_MEMORY_BASE, COMPUTER_MEMORY_SIZE, file_data[2 + loaded_size:])
+        memory.write(load_address, file_data[2:2 + loaded_size])
+        return memory
+
+    @classmethod
+    def from_job_sectors(cls, data_sector: bytes, key_sector: bytes):
+        """Drive memory after the stage 5 jobs: track 18 sector 15 in buffer 0, sector 3 in buffer 4."""
+        memory = cls(0, DRIVE_MEMORY_SIZE)
+        memory.write(BUFFER_0, data_sector[:BUFFER_SIZE])
+        memory.write(BUFFER_4, key_sector[:BUFFER_SIZE])
+        return memory
+
+    @classmethod
+    def from_g64(cls, g64):
+        """Drive memory for stage 6, with the job sectors read from track 18 of an image."""
+        track = g64.get_decoded_track(TrackId(f"{JOB_TRACK}.0"), g64.MODE_GCR)
+        if JOB_SECTOR_DATA not in track or JOB_SECTOR_KEY not in track:
+            raise Exception("Track 18 sectors 15 and 3 not found in " + g64.filename)
+        return cls.from_job_sectors(track[JOB_SECTOR_DATA].data, track[JOB_SECTOR_KEY].data)
+
+
+class XorRegionStage:
+    """destination = memory at target XOR key, where key is the memory at an address or constant bytes."""
+
+    def __init__(self, name, target, key, length, destination=None):
+        self.name = name
+        self.target = target
+        self.key = key
+        self.length = length
+        self.destination = target if destination is None else destination
+
+    def apply_many(self, memories):
+        targets = b"".join(memory.read(self.target, self.length) for memory in memories)
+        if isinstance(self.key, int):
+            decrypted = xor_bytes(targets, b"".join(memory.read(self.key, self.length) for memory in memories))
+        else:
+            decrypted = xor_repeated_key(targets, self.key)
+        for i, memory in enumerate(memories):
+            memory.write(self.destination, decrypted[i * self.length:(i + 1) * self.length])
+
+
+class PairStreamStage:
+    """Stage 3: pairs read from the serial bus with Y counting down, the first byte of each pair
+    stored at data,Y and the first XOR the second at data_2,Y."""
+
+    def __init__(self, name, pairs, data, data_2):
+        self.name = name
+        self.pairs = pairs
+        self.data = data
+        self.data_2 = data_2
+
+    def apply_many(self, memories):
+        size = self.pairs * 2
+        for memory in memories:
+            if len(memory.stream) < size:
+                raise Exception("%s needs %d bytes from the serial bus, only %d left" % (self.name, size, len(memory.stream)))
+        firsts = b"".join(memory.stream[0:size:2] for memory in memories)
+        seconds = b"".join(memory.stream[1:size:2] for memory in memories)
+        xored = xor_bytes(firsts, seconds)
+        for i, memory in enumerate(memories):
+            part = slice(i * self.pairs, (i + 1) * self.pairs)
+            # The first pair goes to the highest Y
+            memory.write(self.data, firsts[part][::-1])
+            memory.write(self.data_2, xored[part][::-1])
+            memory.stream = memory.stream[size:]
+
+
+STAGE2 = XorRegionStage("stage 2", STAGE2_DATA, STAGE2_KEY, STAGE2_LENGTH)
+STAGE3 = PairStreamStage("stage 3", STAGE3_PAIRS, STAGE3_DATA, STAGE3_DATA_2)
+STAGE6 = XorRegionStage("stage 6", BUFFER_0, BUFFER_4, BUFFER_SIZE)
+
+
+class DecryptorPipeline:
+    """Stages applied in order, each one to every memory at once."""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def then(self, stage):
+        return DecryptorPipeline(self.stages + [stage])
+
+    def run(self, memory: LoaderMemory) -> LoaderMemory:
+        return self.run_many([memory])[0]
+
+    def run_many(self, memories) -> list[LoaderMemory]:
+        memories = list(memories)
+        for stage in self.stages:
+            if TRACER.enabled:
+                TRACER.debug("%s on %d memories", stage.name, len(memories))
+            stage.apply_many(memories)
+        return memories
+
+
+COMPUTER_PIPELINE = DecryptorPipeline([STAGE2, STAGE3])
+DRIVE_PIPELINE = DecryptorPipeline([STAGE6])
+
+
+def decrypt_loader_files(files) -> list[LoaderMemory]:
+    """Stages 2 and 3 over many copies of the loader file."""
+    return COMPUTER_PIPELINE.run_many(LoaderMemory.from_loader_file(file_data) for file_data in files)
+
+
+def decrypt_job_sectors(images) -> list[bytes]:
+    """Stage 6 over many G64 images: the decrypted buffer 0 of each, the code the drive runs at $0300."""
+    memories = DRIVE_PIPELINE.run_many(LoaderMemory.from_g64(g64) for g64 in images)
+    return [memory.read(BUFFER_0, BUFFER_SIZE) for memory in memories]
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from decode_metrics import NULL_METRICS
 from disk_entities import Track
 
 SECTOR_HEADER_SIZE = 7
@@ -13,23 +14,47 @@ SECTORS_COUNT_FOR_TRACKS_19_AND_ABOVE = 10
 
 
 class RapidlokTrackReader:
-    def __init__(self, track_number, data):
+    def __init__(self, track_number, data, metrics=None, sectors=None):
+        # sectors: the sector numbers to decode, None for all of them. Every header is still
+        # located, so sector boundaries and missing/duplicate headers are the same either way.
         self.track_data = data
+        self.track_bytes = bytes(data)
         self.track_number = track_number
+        self.metrics = metrics or NULL_METRICS
+        self.wanted_sectors = None if sectors is None else set(sectors)
+        self.missing_sectors: list[int] = []
+        self.duplicate_sectors: dict[int, list[int]] = {}
+        self.unformatted_sectors: list[int] = []
         self.total_sectors = self.compute_total_sectors(self.track_number)
-        self.decoded_sectors = self.read_track()
+        with self.metrics.stage("rapidlok_track"):
+            self.track = self.read_track()
+        if self.metrics.enabled:
+            self.count_track_metrics()
 
     def get_track(self) -> Track:
-        return Track(self.track_number, self.decoded_sectors, self.track_data)
+        return self.track
 
     def read_track(self):
         sector_starts = self.find_sector_start_positions()
         sector_positions = self.build_ordered_dict_by_positions(sector_starts)
         raw_sectors = self.split_into_raw_sectors(sector_positions)
+        if self.wanted_sectors is not None:
+            raw_sectors = {n: raw_data for n, raw_data in raw_sectors.items() if n in self.wanted_sectors}
         return self.decode_sectors(raw_sectors)
 
+    def count_track_metrics(self):
+        metrics = self.metrics
+        metrics.count("tracks_decoded")
+        metrics.count("bytes_scanned", len(self.track_bytes))
+        metrics.count("headers_found", self.total_sectors + 1 - len(self.missing_sectors))
+        metrics.count("headers_missing", len(self.missing_sectors))
+        metrics.count("headers_duplicated", len(self.duplicate_sectors))
+        metrics.count("sectors_unformatted", len(self.unformatted_sectors))
+        metrics.count("sectors_decoded", len(self.track))
+
     def split_into_raw_sectors(self, sector_positions):
         raw_sector_data: dict[int, list[int]] = {}
+        self.unformatted_sectors = []
         positions = list(sector_positions.items())
         for i, (start_pos, sector_num) in enumerate(positions):
             end_pos = positions[i + 1][0] if i < len(positions) - 1 else len(self.track_data)
@@ -45,6 +70,7 @@ class RapidlokTrackReader:
 
             #Some sectors might be unformatted, so if we couldn't find the sequence in the first 32 bytes, skip the sector
             if pos == 32 or pos == len(data):
+                self.unformatted_sectors.append(sector_num)
                 continue
 
             #Skip the 2 bytes of the sequence
@@ -53,29 +79,47 @@ class RapidlokTrackReader:
             raw_sector_data[sector_num] = data[pos:]
         return raw_sector_data
 
-    def decode_sectors(self, raw_sectors):
-        decoded_sectors: dict[int, list[int]] = {}
+    def decode_sectors(self, raw_sectors) -> Track:
+        # Decode all sectors of the track in one go: their staggered triples are laid
+        # back to back and decoded together. The decoded track is kept as the buffer of
+        # the Track, each sector pointing at its 2 output bytes per triple.
+        total_bytes = UNPACKED_TRIPLES_PER_SECTOR * BYTES_PER_TRIPLE
+        chunks = []
         for sector_number, raw_data in raw_sectors.items():
-            # Unpack interleaved bytes (0,1,2), (3,4,5), ... into three streams using slicing with step
-            total_bytes = UNPACKED_TRIPLES_PER_SECTOR * BYTES_PER_TRIPLE
             chunk = raw_data[:total_bytes]
-            unpacked_data_1 = chunk[0::3]
-            unpacked_data_2 = chunk[1::3]
-            unpacked_data_3 = chunk[2::3]
-            processed_data = process_unpacked_data(unpacked_data_1, unpacked_data_2, unpacked_data_3)
-            # Remove the last bytes used for checksum
-            decoded_sectors[sector_number] = processed_data[:-CHECKSUM_SIZE]
-        return decoded_sectors
+            chunks.append((sector_number, len(chunk) - len(chunk) % BYTES_PER_TRIPLE))
+        processed_track = decode_staggered_triples(b"".join(raw_sectors[n][:length] for n, length in chunks))
+
+        sector_ranges: dict[int, tuple[int, int]] = {}
+        pos = 0
+        for sector_number, length in chunks:
+            decoded_length = length // BYTES_PER_TRIPLE * 2
+            # Leave out the last bytes used for checksum
+            sector_ranges[sector_number] = (pos, max(pos, pos + decoded_length - CHECKSUM_SIZE))
+            pos += decoded_length
+        return Track(self.track_number, processed_track, sector_ranges)
 
     def find_sector_start_positions(self) -> dict[int, int]:
+        # Locate every expected header in one pass over the track, keeping the first
+        # occurrence of each. Missing and repeated headers are recorded, not guessed at.
+        headers = {i: self.create_header_for_sector(i) for i in range(self.total_sectors + 1)}
+        header_positions = self.find_all_sequences(self.track_bytes, headers)
+
         sector_starts: dict[int, int] = {}
-        for i in range(self.total_sectors + 1):
-            sector_starts[i] = self.find_sector_start(i)
+        self.missing_sectors = []
+        self.duplicate_sectors = {}
+        for sector_number, positions in header_positions.items():
+            if not positions:
+                self.missing_sectors.append(sector_number)
+                continue
+            if len(positions) > 1:
+                self.duplicate_sectors[sector_number] = positions
+            sector_starts[sector_number] = positions[0]
         return sector_starts
 
     def find_sector_start(self, sector_number: int) -> int:
         header = self.create_header_for_sector(sector_number)
-        return self.find_sequence(self.track_data, header)
+        return self.track_bytes.find(header)
 
     @staticmethod
     def build_ordered_dict_by_positions(sector_starts):
@@ -88,21 +132,33 @@ class RapidlokTrackReader:
 
     @staticmethod
     def find_sequence(data: list[int], sequence: list[int]) -> int:
-        if len(sequence) > len(data):
-            return -1
-        for i in range(len(data) - len(sequence) + 1):
-            if all(data[i + j] == sequence[j] for j in range(len(sequence))):
-                return i
-        return -1
-
-    def create_header_for_sector(self, sector_number: int) -> list[int]:
-        h1, h2, h3 = create_bitstream(self.track_number, sector_number)
-        h4, h5, h6 = create_bitstream(self.track_number ^ sector_number ^ 0x96, 0x96)
-        return [0x75, h1, h2, h3, h4, h5, h6]
+        return bytes(data).find(bytes(sequence))
+
+    @staticmethod
+    def find_all_sequences(data: bytes, sequences: dict[int, bytes]) -> dict[int, list[int]]:
+        # All positions of each sequence, found with bytes.find instead of a per-position Python loop
+        positions: dict[int, list[int]] = {}
+        for key, sequence in sequences.items():
+            found = []
+            pos = data.find(sequence)
+            while pos != -1:
+                found.append(pos)
+                pos = data.find(sequence, pos + 1)
+            positions[key] = found
+        return positions
+
+    def create_header_for_sector(self, sector_number: int) -> bytes:
+        return create_sector_header(self.track_number, sector_number)
 
     def sector_payload_offset(self) -> int:
         return SECTOR_HEADER_SIZE + SECTOR_GAP_SIZE
 
+def create_sector_header(track_number: int, sector_number: int) -> bytes:
+    """The 7 header bytes identifying a sector, written and searched for as they are."""
+    h1, h2, h3 = create_bitstream(track_number, sector_number)
+    h4, h5, h6 = create_bitstream(track_number ^ sector_number ^ 0x96, 0x96)
+    return bytes([0x75, h1, h2, h3, h4, h5, h6])
+
 def create_bitstream(a, x):
     low_a, hi_a = get_nibbles(a)
     low_x, hi_x = get_nibbles(x)
@@ -124,22 +180,50 @@ def unpack_data(packed_data):
         unpacked_data_3.append(bitstream_3)
     return unpacked_data_1, unpacked_data_2, unpacked_data_3
 
+def compact_triple_bits(value):
+    # Process the 24 bits in groups of 3, keeping only the 2nd and 3rd bits of each
+    output = 0
+    for bit_pos in range(23, -1, -3):  # Start from MSB
+        three_bits = (value >> (bit_pos - 2)) & 0x7
+        two_bits = three_bits & 0x3  # Keep only the last 2 bits
+        output = (output << 2) | two_bits
+    return output
+
+def build_triple_tables():
+    # Each byte of a triple feeds its own bits of the 16-bit output, so the output is the OR
+    # of three per-byte lookups. The final XOR with 0xffff is folded into each table.
+    # Returns, for each triple byte, a (high output byte, low output byte) pair of translate tables.
+    tables = []
+    for byte_index in range(BYTES_PER_TRIPLE):
+        shift = 16 - byte_index * 8
+        mask = compact_triple_bits(0xFF << shift)
+        outputs = [compact_triple_bits(b << shift) ^ mask for b in range(256)]
+        tables.append((bytes(o >> 8 for o in outputs), bytes(o & 0xFF for o in outputs)))
+    return tuple(tables)
+
+TRIPLE_TABLES = build_triple_tables()
+
+def decode_triple_streams(unpacked_data_1: bytes, unpacked_data_2: bytes, unpacked_data_3: bytes) -> bytes:
+    # Same output as process_unpacked_data, for whole streams at once
+    count = len(unpacked_data_1)
+    high = 0
+    low = 0
+    for stream, (high_table, low_table) in zip((unpacked_data_1, unpacked_data_2, unpacked_data_3), TRIPLE_TABLES):
+        high |= int.from_bytes(stream.translate(high_table), "big")
+        low |= int.from_bytes(stream.translate(low_table), "big")
+    result = bytearray(count * 2)
+    result[0::2] = high.to_bytes(count, "big")
+    result[1::2] = low.to_bytes(count, "big")
+    return bytes(result)
+
+def decode_staggered_triples(data: bytes) -> bytes:
+    # Unpack interleaved bytes (0,1,2), (3,4,5), ... into three streams and decode them
+    data = bytes(data)
+    return decode_triple_streams(data[0::3], data[1::3], data[2::3])
+
 def process_unpacked_data(unpacked_data_1, unpacked_data_2, unpacked_data_3):
-    result = []
-    for i in range(len(unpacked_data_1)):
-        # Concatenate 24 bits from three bytes
-        value = (unpacked_data_1[i] << 16) | (unpacked_data_2[i] << 8) | unpacked_data_3[i]
-        # Process bits in groups of 3, keeping only 2nd and 3rd bits
-        output = 0
-        for bit_pos in range(23, -1, -3):  # Start from MSB
-            if bit_pos >= 2:  # Ensure we have 3 bits to process
-                three_bits = (value >> (bit_pos - 2)) & 0x7
-                two_bits = three_bits & 0x3  # Keep only the last 2 bits
-                output = (output << 2) | two_bits
-        output ^= 0xffff
-        result.append((output & 0xFF00) >> 8)
-        result.append(output & 0xFF)
-    return result
+    count = len(unpacked_data_1)
+    return list(decode_triple_streams(bytes(unpacked_data_1), bytes(unpacked_data_2[:count]), bytes(unpacked_data_3[:count])))
 
 def get_nibbles(n):
     return n & 0x0f, (n & 0xF0) >> 4
@@ -0,0 +1,95 @@
+from rapidlok_track_reader import (BYTES_PER_TRIPLE, CHECKSUM_SIZE, SECTOR_HEADER_SIZE, UNPACKED_TRIPLES_PER_SECTOR,
+                                   RapidlokTrackReader, create_sector_header)
+
+# Layout written around each sector. The reader only needs the header, and 0xFF 0x6B
+# within 32 bytes of it followed by the triples.
+SECTOR_SYNC = b"\xff" * 6
+SECTOR_HEADER_GAP = b"\x55" * 12
+PAYLOAD_MARK = b"\xff\x6b"
+SECTOR_TRAILING_GAP = b"\x55" * 4
+SECTOR_PAYLOAD_SIZE = UNPACKED_TRIPLES_PER_SECTOR * 2 - CHECKSUM_SIZE  # 384
+# The reader looks for the payload mark this far from the start of the header
+PAYLOAD_MARK_SEARCH_END = 32
+# The first bit of every 3-bit group is dropped by the decoder, written as 1
+FILLER_BIT = 0b100
+
+
+def expand_word_bits(word, first_group, last_group):
+    # Spread 2-bit pairs of a 16-bit word over 3-bit groups of a triple, for groups first..last only
+    value = 0
+    for group in range(first_group, last_group):
+        pair = (word >> (14 - group * 2)) & 3
+        value |= (FILLER_BIT | pair) << (21 - group * 3)
+    return value
+
+
+def build_payload_tables():
+    # Inverse of build_triple_tables: the high byte of a decoded word sets groups 0-3 of the
+    # triple, the low byte groups 4-7. The XOR with 0xffff is folded into the tables.
+    # Returns, for each triple byte, a (high input byte table, low input byte table) pair.
+    high_values = [expand_word_bits((b ^ 0xFF) << 8, 0, 4) for b in range(256)]
+    low_values = [expand_word_bits(b ^ 0xFF, 4, 8) for b in range(256)]
+    tables = []
+    for byte_index in range(BYTES_PER_TRIPLE):
+        shift = 16 - byte_index * 8
+        tables.append((bytes((v >> shift) & 0xFF for v in high_values),
+                       bytes((v >> shift) & 0xFF for v in low_values)))
+    return tuple(tables)
+
+
+PAYLOAD_TABLES = build_payload_tables()
+
+
+def encode_staggered_triples(data: bytes) -> bytes:
+    """Encode decoded bytes (an even number of them) as triples, the inverse of decode_staggered_triples."""
+    if len(data) % 2 != 0:
+        raise Exception("Payload bytes not multiple of 2")
+    data = bytes(data)
+    count = len(data) // 2
+    high_stream, low_stream = data[0::2], data[1::2]
+    triples = bytearray(count * BYTES_PER_TRIPLE)
+    for byte_index, (high_table, low_table) in enumerate(PAYLOAD_TABLES):
+        value = int.from_bytes(high_stream.translate(high_table), "big")
+        value |= int.from_bytes(low_stream.translate(low_table), "big")
+        triples[byte_index::BYTES_PER_TRIPLE] = value.to_bytes(count, "big")
+    return bytes(triples)
+
+
+def encode_sector(track_number: int, sector_number: int, payload: bytes, checksum: bytes = bytes(CHECKSUM_SIZE)) -> bytes:
+    """Sync, header, gap and the triples of a 384 byte sector.
+
+    The reader drops the checksum bytes without checking them, so they are written as given.
+    """
+    if len(payload) != SECTOR_PAYLOAD_SIZE:
+        raise Exception("Sector payload must be %d bytes" % SECTOR_PAYLOAD_SIZE)
+    return b"".join([SECTOR_SYNC, create_sector_header(track_number, sector_number), SECTOR_HEADER_GAP,
+                     PAYLOAD_MARK, encode_staggered_triples(bytes(payload) + bytes(checksum)), SECTOR_TRAILING_GAP])
+
+
+def encode_track(track_number: int, payloads: dict[int, bytes]) -> bytes:
+    """The bytes of a Rapidlok track with the given {sector: payload}, in sector order.
+    Sectors missing from payloads are left out, as they would be on a damaged track."""
+    return b"".join(encode_sector(track_number, sector, payloads[sector])
+                    for sector in range(RapidlokTrackReader.compute_total_sectors(track_number) + 1)
+                    if sector in payloads)
+
+
+def patch_sector(track_data, track_number: int, sector_number: int, payload: bytes) -> bytes:
+    """Copy of a track (as read from a G64) with the payload of one sector replaced in place.
+    Everything else on the track stays as it was, including the sector's checksum bytes."""
+    if len(payload) != SECTOR_PAYLOAD_SIZE:
+        raise Exception("Sector payload must be %d bytes" % SECTOR_PAYLOAD_SIZE)
+    track_bytes = bytearray(track_data)
+    header_pos = track_bytes.find(create_sector_header(track_number, sector_number))
+    if header_pos == -1:
+        raise Exception("Sector %d not found on track %d" % (sector_number, track_number))
+    mark_pos = track_bytes.find(PAYLOAD_MARK, header_pos + SECTOR_HEADER_SIZE, header_pos + PAYLOAD_MARK_SEARCH_END + 1)
+    if mark_pos == -1:
+        raise Exception("Sector %d on track %d is not formatted" % (sector_number, track_number))
+
+    start = mark_pos + len(PAYLOAD_MARK)
+    triples = encode_staggered_triples(payload)
+    if start + UNPACKED_TRIPLES_PER_SECTOR * BYTES_PER_TRIPLE > len(track_bytes):
+        raise Exception("Sector %d runs past the end of track %d" % (sector_number, track_number))
+    track_bytes[start:start + len(triples)] = triples
+    return bytes(track_bytes)
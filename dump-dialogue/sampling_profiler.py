@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.001
+SUMMARY_SUFFIX = ".summary.txt"
+SUMMARY_TOP_FUNCTIONS = 10
+
+
+class SamplingProfiler:
+    """Samples the stack of the thread that started it every interval seconds.
+
+    Stacks are kept as tuples of "module:function" labels, outermost first, and can be
+    written in the collapsed format flame graph tools read ("a;b;c count" per line).
+    Samples from other processes (batch workers) are added with merge.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.labels = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.target_id = threading.get_ident()
+        self.stop_event.clear()
+        # The sampler needs the GIL to take a sample, so let threads switch at least as often
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread = threading.Thread(target=self.sample_loop, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        sys.setswitchinterval(self.switch_interval)
+
+    def sample_loop(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_id)
+            if frame is not None:
+                self.stacks[self.get_stack(frame)] += 1
+                # Don't keep the sampled frames and their locals alive until the next sample
+                del frame
+
+    def get_stack(self, frame) -> tuple:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = get_module_name(code.co_filename) + ":" + code.co_name
+                self.labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def merge(self, stacks):
+        self.stacks.update(stacks)
+
+    def get_module_summary(self) -> dict[str, dict[str, list[int]]]:
+        """{module: {function: [self samples, total samples]}}, a function counted once per stack."""
+        modules: dict[str, dict[str, list[int]]] = {}
+        for stack, count in self.stacks.items():
+            for position, label in enumerate(stack):
+                if label in stack[position + 1:]:
+                    # Recursive call, counted at its innermost frame
+                    continue
+                module, function = label.split(":", 1)
+                counts = modules.setdefault(module, {}).setdefault(function, [0, 0])
+                counts[1] += count
+            module, function = stack[-1].split(":", 1)
+            modules[module][function][0] += count
+        return modules
+
+    def format_summary(self, top_functions=SUMMARY_TOP_FUNCTIONS) -> str:
+        total = sum(self.stacks.values())
+        if not total:
+            return "No samples\n"
+        modules = self.get_module_summary()
+        module_self = {module: sum(counts[0] for counts in functions.values()) for module, functions in modules.items()}
+        lines = [f"{total} samples, {self.interval * 1000:g} ms apart", "",
+                 f"{'module / function':<50}{'self':>8}{'total':>8}{'self %':>8}"]
+        for module in sorted(modules, key=lambda m: -module_self[m]):
+            if not module_self[module]:
+                continue
+            lines.append(f"{module:<50}{module_self[module]:>8}{'':>8}{module_self[module] / total:>8.1%}")
+            functions = sorted(modules[module].items(), key=lambda item: (-item[1][0], -item[1][1]))
+            for function, (self_count, total_count) in functions[:top_functions]:
+                lines.append(f"  {function:<48}{self_count:>8}{total_count:>8}{self_count / total:>8.1%}")
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed(self, stream):
+        for stack, count in sorted(self.stacks.items()):
+            stream.write(";".join(stack) + " " + str(count) + "\n")
+
+    def save(self, filename):
+        """Write the collapsed stacks to filename and the summary by module next to it."""
+        with open(filename, "w") as file:
+            self.write_collapsed(file)
+        with open(filename + SUMMARY_SUFFIX, "w") as file:
+            file.write(self.format_summary())
+
+
+def get_module_name(filename) -> str:
+    # Scripts and modules of this directory by file name, e.g. law-west-decoder or g64
+    return os.path.splitext(os.path.basename(filename))[0]
@@ -6,3 +6,17 @@ class SceneLocation:
         self.end_sector = end_sector
 
 
+# Where each scene's data starts and ends on disk (scenes 1-4 on side 1, the rest on side 2)
+SCENE_LOCATIONS = {
+    "1": SceneLocation(2, 1, 4, 10),
+    "2": SceneLocation(7, 9, 10, 6),
+    "3": SceneLocation(4, 11, 7, 8),
+    "4": SceneLocation(13, 5, 16, 2),
+    "5": SceneLocation(28, 5, 31, 5),
+    "6": SceneLocation(22, 3, 25, 3),
+    "7": SceneLocation(25, 4, 28, 4),
+    "8": SceneLocation(31, 6, 34, 6),
+    "9": SceneLocation(34, 7, 2, 6),
+    "10": SceneLocation(2, 7, 5, 4),
+    "11": SceneLocation(5, 5, 8, 2),
+}
@@ -0,0 +1,221 @@
+import argparse
+import json
+from dataclasses import dataclass
+
+from dialogue_index import get_selections_for_path
+from game_score import (AUTHORITY, CRIMES_COMMITTED, CROOKS_CAPTURED, LAWFUL_KILLS, METRIC_CAP, METRIC_NAMES,
+                        POSITIVE_METRICS, ROBBERIES, ROMANCE, compute_score, get_final_metrics, get_running_total,
+                        get_score_for_total, scale_authority)
+from outcome_analytics import NOT_APPLICABLE, OutcomeAnalytics
+from score_simulator import (AMBUSH_STATES, CROOK_CAPTURED, DRAW_DELAYS, DRAW_IF_SHERIFF_DRAWS, GANG_MEMBER_KILLED,
+                             GANG_SHOOTOUT, LAWFUL_KILL, SURRENDER_IF_SHERIFF_DRAWS, SURRENDER_STATES,
+                             get_game_metrics, get_metric, get_metric_delta)
+
+# The highest final score over every choice of dialogue paths, for a sheriff who wins every fight,
+# is never injured and never shoots anyone unlawfully. Games are packed ints as in score_simulator.
+#
+# Each scene is collapsed to the distinct metrics its paths and what follows them can add, then to
+# the Pareto front of those, and a dynamic programming pass over the scenes keeps every distinct
+# game reachable so far with one way of reaching it. The front is enough as long as the score
+# can only grow with every metric: the running total stays below the one where 285 times it
+# wraps past 9999, and authority below 128, where its ASL wraps. Otherwise every distinct option
+# is kept.
+#
+# In the first case, a metric no game can push past its cap adds to the running total exactly
+# what it counts, so all such metrics are searched as their sum, in LINEAR_FIELD.
+
+# 36 * 285 = 10260, the first running total whose score wraps
+WRAPPING_TOTAL = 36
+AUTHORITY_WRAP = 128
+# Metrics raising the running total one for one below their cap. The crimes_committed field of
+# a game counts the gang members killed, each one a robbery less.
+LINEAR_CAPS = {CROOKS_CAPTURED: METRIC_CAP, ROMANCE: METRIC_CAP, LAWFUL_KILLS: METRIC_CAP, CRIMES_COMMITTED: ROBBERIES}
+LINEAR_FIELD = len(METRIC_NAMES)
+DELTA_NAMES = METRIC_NAMES[:CRIMES_COMMITTED] + ("robberies_prevented",)
+
+
+def get_perfect_play_events(npc_state) -> list[tuple[str, int]]:
+    """(what the sheriff does, metrics added) for every way a conversation ending in npc_state
+    can go on without injury or unlawful kill."""
+    if npc_state in DRAW_DELAYS or npc_state in AMBUSH_STATES:
+        return [("win the fight", LAWFUL_KILL)]
+    if npc_state == DRAW_IF_SHERIFF_DRAWS:
+        return [("let him leave", 0), ("draw and win the fight", LAWFUL_KILL)]
+    if npc_state in SURRENDER_STATES:
+        return [("capture him", CROOK_CAPTURED)]
+    if npc_state == SURRENDER_IF_SHERIFF_DRAWS:
+        return [("let him leave", 0), ("draw, he surrenders", CROOK_CAPTURED)]
+    if npc_state == GANG_SHOOTOUT:
+        return [("kill the gang member", GANG_MEMBER_KILLED)]
+    return [("let him leave", 0)]
+
+
+def get_metrics_vector(delta: int) -> tuple[int, ...]:
+    return tuple(get_metric(delta, metric) for metric in range(len(METRIC_NAMES)))
+
+
+def get_pareto_front(deltas) -> list[int]:
+    """The deltas no other delta is greater or equal to on every metric."""
+    vectors = {delta: tuple(get_metric(delta, field) for field in range(LINEAR_FIELD + 1)) for delta in deltas}
+    return [delta for delta in deltas
+            if not any(other != delta and all(a >= b for a, b in zip(vectors[other], vectors[delta]))
+                       for other in deltas)]
+
+
+@dataclass
+class SceneChoice:
+    scene: int
+    # Every (selections, action) adding the chosen metrics
+    ways: list[tuple[tuple[int, int, int], str]]
+    metrics: dict[str, int]
+
+
+@dataclass
+class OptimalGame:
+    score: int
+    running_total: int
+    metrics: list[int]
+    final_metrics: list[int]
+    choices: list[SceneChoice]
+    pareto: bool
+    states: int
+
+    def to_dict(self) -> dict:
+        return {"score": self.score, "running_total": self.running_total,
+                "metrics": dict(zip(METRIC_NAMES, self.metrics)),
+                "final_metrics": dict(zip(METRIC_NAMES, self.final_metrics)),
+                "pareto": self.pareto, "states": self.states,
+                "choices": [{"scene": c.scene, "metrics": c.metrics,
+                             "ways": [{"selections": s, "action": a} for s, a in c.ways]} for c in self.choices]}
+
+
+class ScoreOptimizer:
+    def __init__(self, analytics: OutcomeAnalytics):
+        self.analytics = analytics
+        # {scene: {delta: [(selections, action)...]}}
+        self.scene_options = {n: self.get_scene_options(n) for n in analytics.scene_numbers}
+
+    def get_scene_options(self, scene_number) -> dict[int, list[tuple[tuple[int, int, int], str]]]:
+        authority = self.analytics.get_row("authority", scene_number)
+        romance = self.analytics.get_row("romance", scene_number)
+        npc_state = self.analytics.get_row("npc_state", scene_number)
+        options = {}
+        for i, state in enumerate(npc_state):
+            conversation = get_metric_delta(AUTHORITY, authority[i])
+            if romance[i] != NOT_APPLICABLE:
+                conversation += get_metric_delta(ROMANCE, romance[i])
+            for action, event in get_perfect_play_events(state):
+                options.setdefault(conversation + event, []).append((get_selections_for_path(i), action))
+        return options
+
+    def get_bounds(self) -> list[int]:
+        # The best of every metric in every scene together bounds what any game reaches
+        bounds = [0] * len(METRIC_NAMES)
+        for options in self.scene_options.values():
+            vectors = [get_metrics_vector(delta) for delta in options]
+            bounds = [b + max(values) for b, values in zip(bounds, zip(*vectors))]
+        return bounds
+
+    def get_running_total_bound(self, bounds) -> int:
+        # Crooks, romance and lawful kills all come from one conversation, a scene adds at most
+        # the largest sum of them of its options
+        counted = [metric for metric in POSITIVE_METRICS if metric != AUTHORITY]
+        counted_bound = sum(max(sum(get_metric(delta, metric) for metric in counted) for delta in options)
+                            for options in self.scene_options.values())
+        return (min(scale_authority(bounds[AUTHORITY]), METRIC_CAP) + counted_bound
+                + min(bounds[CRIMES_COMMITTED], ROBBERIES) - ROBBERIES)
+
+    def optimize(self) -> OptimalGame:
+        bounds = self.get_bounds()
+        pareto = bounds[AUTHORITY] < AUTHORITY_WRAP and self.get_running_total_bound(bounds) < WRAPPING_TOTAL
+        linear = [metric for metric, cap in LINEAR_CAPS.items() if bounds[metric] <= cap] if pareto else []
+        # One {game: (previous game, delta)} per scene, over reduced games and deltas
+        layers = []
+        scene_deltas = []
+        games = {0: None}
+        for options in self.scene_options.values():
+            reduced = {}
+            for delta in options:
+                reduced.setdefault(reduce_delta(delta, linear), delta)
+            scene_deltas.append(reduced)
+            deltas = get_pareto_front(list(reduced)) if pareto else list(reduced)
+            layer = {}
+            for game in games:
+                for delta in deltas:
+                    if game + delta not in layer:
+                        layer[game + delta] = (game, delta)
+            layers.append(layer)
+            games = layer
+        # The score only depends on the running total
+        totals = {game: get_running_total(get_final_metrics(get_game_metrics(expand_game(game, linear, bounds))))
+                  for game in games}
+        scores = {total: get_score_for_total(total) for total in set(totals.values())}
+        best = max(games, key=lambda game: scores[totals[game]])
+
+        choices = []
+        game_deltas = []
+        for scene_number, layer, reduced in reversed(list(zip(self.scene_options, layers, scene_deltas))):
+            best, delta = layer[best]
+            game_deltas.append(reduced[delta])
+            choices.append(SceneChoice(scene_number, self.scene_options[scene_number][reduced[delta]],
+                                       {n: v for n, v in zip(DELTA_NAMES, get_metrics_vector(reduced[delta])) if v}))
+        choices.reverse()
+        metrics = get_game_metrics(sum(game_deltas))
+        final_metrics = get_final_metrics(metrics)
+        return OptimalGame(compute_score(metrics), get_running_total(final_metrics), metrics, final_metrics, choices,
+                           pareto, sum(len(layer) for layer in layers))
+
+
+def reduce_delta(delta: int, linear) -> int:
+    for metric in linear:
+        value = get_metric(delta, metric)
+        delta += get_metric_delta(LINEAR_FIELD, value) - get_metric_delta(metric, value)
+    return delta
+
+
+def expand_game(game: int, linear, bounds) -> int:
+    # A game with the same running total as a reduced one: its linear sum spread back over the
+    # linear metrics, none past its bound
+    remaining = get_metric(game, LINEAR_FIELD)
+    game -= get_metric_delta(LINEAR_FIELD, remaining)
+    for metric in linear:
+        value = min(remaining, bounds[metric])
+        game += get_metric_delta(metric, value)
+        remaining -= value
+    return game
+
+
+def format_optimal_game(game: OptimalGame) -> str:
+    lines = [f"Maximum score: {game.score:04d} (last 2 digits random in the game), running total {game.running_total}",
+             "Final metrics: " + ", ".join(f"{n} {v}" for n, v in zip(METRIC_NAMES, game.final_metrics)),
+             f"{game.states} games searched" + (" over the Pareto fronts of the scenes" if game.pareto else "")]
+    for choice in game.choices:
+        gains = ", ".join(f"{name} +{value}" for name, value in choice.metrics.items()) or "nothing"
+        lines.append(f"Scene {choice.scene:>2}: {gains}")
+        for selections, action in choice.ways:
+            lines.append(f"  {''.join(map(str, selections))} then {action}")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the dialogue paths giving the maximum final score")
+    parser.add_argument("--index", help="read the outcomes from a dialogue index saved by law-west-decoder --index "
+                                        "instead of decoding side1.g64 and side2.g64")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    if args.index:
+        from dialogue_index import DialogueIndex
+        analytics = OutcomeAnalytics.from_index(DialogueIndex.load(args.index))
+    else:
+        from disk_reader import SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, read_scenes_for_sides
+        from g64 import G64
+        from scene_location import SCENE_LOCATIONS
+        with G64("side1.g64", use_mmap=True) as side_1, G64("side2.g64", use_mmap=True) as side_2:
+            analytics = OutcomeAnalytics.from_scenes_data(read_scenes_for_sides(
+                SCENE_LOCATIONS, [(side_1, SIDE1_EXCLUDED_TRACKS), (side_2, SIDE2_EXCLUDED_TRACKS)]))
+    optimal_game = ScoreOptimizer(analytics).optimize()
+    if args.json:
+        print(json.dumps(optimal_game.to_dict(), indent=1))
+    else:
+        print(format_optimal_game(optimal_game), end="")
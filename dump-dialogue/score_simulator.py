@@ -0,0 +1,441 @@
+import argparse
+import json
+import random
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+
+from game_score import (AUTHORITY, CRIMES_COMMITTED, CROOKS_CAPTURED, LAWFUL_KILLS, METRIC_NAMES, ROBBERIES, ROMANCE,
+                        TIMES_INJURED, UNLAWFUL_KILLS, compute_score, get_final_metrics, get_running_total,
+                        get_score_for_total)
+from outcome_analytics import NOT_APPLICABLE, OutcomeAnalytics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Random playthroughs of the whole game: in every scene the sheriff picks one of the 64
+# dialogue paths at random, and what happens once the conversation is over (drawing, fights,
+# robbery shootouts) is left to the probabilities of a PlayerModel.
+#
+# A game is one int: the 7 metrics in 8-bit fields, metric i at bit 8 * i, then whether the
+# doctor is friendly and whether the sheriff is dead. What a scene can add to a game is a
+# weighted list of such ints, so playing a scene over a whole batch is drawing from that list
+# and adding. The crimes_committed field counts the Dalton gang members killed, the game
+# takes them off the 6 robberies. Games are scored once per distinct final state.
+
+METRIC_BITS = 8
+DOCTOR_FRIENDLY = 1 << (METRIC_BITS * len(METRIC_NAMES))
+DEAD = DOCTOR_FRIENDLY << 1
+DOCTOR_FRIENDLY_STATE = 3
+# A friendly doctor heals the first 2 injuries, the third one makes him drunk
+MAX_HEALED_INJURIES = 2
+# An unlawful kill while the doctor is in town makes him hostile ($8a76-$8a7c)
+NOT_DOCTOR_FRIENDLY = ~DOCTOR_FRIENDLY
+DEFAULT_GAMES = 1000000
+DEFAULT_BATCH_SIZE = 100000
+SCORE_BUCKET = 100
+# The backends agree when the chi-squared statistic of their score histograms is below its
+# quantile this many standard deviations up (99.9%). Scores seen in fewer games are pooled.
+COMPARISON_Z = 3.09
+MIN_BIN_GAMES = 10
+
+# NPC states (outcome & 0x1F) after a conversation
+DRAW_DELAYS = {1: 5, 9: 2, 19: 1}
+DRAW_IF_SHERIFF_DRAWS = 2
+LEAVING_STATES = (3, 8, 15)
+SURRENDER_STATES = (4, 5)
+SURRENDER_IF_SHERIFF_DRAWS = 6
+GANG_SHOOTOUT = 7
+AMBUSH_STATES = (18, 21)
+
+
+def get_metric_delta(metric, value=1) -> int:
+    return value << (METRIC_BITS * metric)
+
+
+def get_metric(game: int, metric) -> int:
+    return (game >> (METRIC_BITS * metric)) & 0xFF
+
+
+INJURY = get_metric_delta(TIMES_INJURED)
+LAWFUL_KILL = get_metric_delta(LAWFUL_KILLS)
+UNLAWFUL_KILL = get_metric_delta(UNLAWFUL_KILLS)
+CROOK_CAPTURED = get_metric_delta(CROOKS_CAPTURED)
+GANG_MEMBER_KILLED = get_metric_delta(CRIMES_COMMITTED) + LAWFUL_KILL
+
+
+@dataclass
+class PlayerModel:
+    """What the sheriff does once a conversation is over, as probabilities."""
+    # Drawing on an NPC who surrenders or draws back if he does (states 6 and 2)
+    draw_probability: float = 0.5
+    # Winning a fight against an NPC drawing with a delay of 5, 2 or 1
+    fight_win_probability: dict[int, float] = field(default_factory=lambda: {5: 0.9, 2: 0.7, 1: 0.5})
+    # Winning against an NPC shooting from the street or on exit, or drawing back
+    ambush_win_probability: float = 0.6
+    # Killing the gang member of a robbery shootout
+    gang_win_probability: float = 0.7
+    # Shooting an NPC who was leaving peacefully
+    trigger_happy_probability: float = 0.05
+
+    def get_events(self, npc_state) -> list[tuple[float, int]]:
+        """(probability, metrics added) of what can follow a conversation ending in npc_state."""
+        if npc_state in DRAW_DELAYS:
+            win = self.fight_win_probability[DRAW_DELAYS[npc_state]]
+            return [(win, LAWFUL_KILL), (1 - win, INJURY)]
+        if npc_state in AMBUSH_STATES:
+            return [(self.ambush_win_probability, LAWFUL_KILL), (1 - self.ambush_win_probability, INJURY)]
+        if npc_state == DRAW_IF_SHERIFF_DRAWS:
+            return [(1 - self.draw_probability, 0),
+                    (self.draw_probability * self.ambush_win_probability, LAWFUL_KILL),
+                    (self.draw_probability * (1 - self.ambush_win_probability), INJURY)]
+        if npc_state in SURRENDER_STATES:
+            return [(1, CROOK_CAPTURED)]
+        if npc_state == SURRENDER_IF_SHERIFF_DRAWS:
+            return [(self.draw_probability, CROOK_CAPTURED), (1 - self.draw_probability, 0)]
+        if npc_state == GANG_SHOOTOUT:
+            return [(self.gang_win_probability, GANG_MEMBER_KILLED), (1 - self.gang_win_probability, INJURY)]
+        if npc_state in LEAVING_STATES:
+            return [(self.trigger_happy_probability, UNLAWFUL_KILL), (1 - self.trigger_happy_probability, 0)]
+        return [(1, 0)]
+
+
+class SceneDistribution:
+    """What one scene adds to a game, as distinct deltas and their cumulative weights."""
+
+    def __init__(self, scene_number, weights: dict[int, float]):
+        self.scene_number = scene_number
+        self.deltas = [delta for delta, weight in weights.items() if weight > 0]
+        self.weights = [weights[delta] for delta in self.deltas]
+        self.cum_weights = []
+        total = 0.0
+        for weight in self.weights:
+            total += weight
+            self.cum_weights.append(total)
+        self.injuring = {delta for delta in self.deltas if get_metric(delta, TIMES_INJURED)}
+        self.unlawful = {delta for delta in self.deltas if get_metric(delta, UNLAWFUL_KILLS)}
+
+    @classmethod
+    def from_analytics(cls, analytics: OutcomeAnalytics, scene_number, model: PlayerModel):
+        authority = analytics.get_row("authority", scene_number)
+        romance = analytics.get_row("romance", scene_number)
+        doctor_state = analytics.get_row("doctor_state", scene_number)
+        npc_state = analytics.get_row("npc_state", scene_number)
+        weights: dict[int, float] = {}
+        path_weight = 1 / len(npc_state)
+        for i, state in enumerate(npc_state):
+            conversation = get_metric_delta(AUTHORITY, authority[i])
+            if romance[i] != NOT_APPLICABLE:
+                conversation += get_metric_delta(ROMANCE, romance[i])
+            for probability, event in model.get_events(state):
+                delta = conversation + event
+                # A doctor who gets shot is out of town again
+                if doctor_state[i] == DOCTOR_FRIENDLY_STATE and not event & (LAWFUL_KILL | UNLAWFUL_KILL):
+                    delta |= DOCTOR_FRIENDLY
+                weights[delta] = weights.get(delta, 0.0) + path_weight * probability
+        return cls(scene_number, weights)
+
+
+def wound(game: int) -> int:
+    # Called with the injury already counted
+    if game & DOCTOR_FRIENDLY and get_metric(game, TIMES_INJURED) <= MAX_HEALED_INJURIES:
+        return game
+    return game | DEAD
+
+
+def get_game_metrics(game: int) -> list[int]:
+    """The raw metrics game_over reads, crimes_committed being the robberies not prevented."""
+    metrics = [get_metric(game, metric) for metric in range(len(METRIC_NAMES))]
+    metrics[CRIMES_COMMITTED] = ROBBERIES - min(metrics[CRIMES_COMMITTED], ROBBERIES)
+    return metrics
+
+
+def play_batch_python(scenes, size, rng: random.Random) -> Counter:
+    games = [0] * size
+    for scene in scenes:
+        deltas = rng.choices(scene.deltas, cum_weights=scene.cum_weights, k=size)
+        injuring = scene.injuring
+        unlawful = scene.unlawful
+        games = [game if game & DEAD else
+                 wound(game + delta) if delta in injuring else
+                 (game + delta) & NOT_DOCTOR_FRIENDLY if delta in unlawful else
+                 game + delta
+                 for game, delta in zip(games, deltas)]
+    return Counter(games)
+
+
+def build_alias_table(weights) -> tuple[list[float], list[int]]:
+    """Walker's alias table of the weights: pick a column i uniformly, keep it with probability
+    probabilities[i] and take aliases[i] otherwise."""
+    count = len(weights)
+    total = sum(weights)
+    probabilities = [weight * count / total for weight in weights]
+    aliases = list(range(count))
+    small = [i for i, p in enumerate(probabilities) if p < 1]
+    large = [i for i, p in enumerate(probabilities) if p >= 1]
+    while small and large:
+        short, tall = small.pop(), large.pop()
+        aliases[short] = tall
+        probabilities[tall] -= 1 - probabilities[short]
+        (small if probabilities[tall] < 1 else large).append(tall)
+    # What is left is 1 but for rounding
+    for i in small + large:
+        probabilities[i] = 1.0
+    return probabilities, aliases
+
+
+def play_batch_numpy(scenes, size, rng):
+    """The distinct final games of a batch and how many times each, as 2 arrays."""
+    all_bits = (1 << 64) - 1
+    games = numpy.zeros(size, numpy.uint64)
+    dead = numpy.uint64(DEAD)
+    dead_shift = numpy.uint64(DEAD.bit_length() - 1)
+    doctor_friendly = numpy.uint64(DOCTOR_FRIENDLY)
+    injury_bits = numpy.uint64(DOCTOR_FRIENDLY | get_metric_delta(TIMES_INJURED, 0xFF))
+    max_healed = numpy.uint64(get_metric_delta(TIMES_INJURED, MAX_HEALED_INJURIES))
+    for scene in scenes:
+        probabilities, aliases = build_alias_table(scene.weights)
+        # One more choice adding nothing, for the games already over
+        over = len(scene.deltas)
+        deltas = numpy.array(scene.deltas + [0], numpy.uint64)
+        kept_bits = numpy.array([all_bits & NOT_DOCTOR_FRIENDLY if delta in scene.unlawful else all_bits
+                                 for delta in scene.deltas] + [all_bits], numpy.uint64)
+        injuring = numpy.array([delta in scene.injuring for delta in scene.deltas] + [False])
+
+        columns = rng.random(size) * over
+        chosen = columns.astype(numpy.intp)
+        chosen = numpy.where(columns - chosen < numpy.array(probabilities)[chosen], chosen,
+                             numpy.array(aliases)[chosen])
+        chosen[games >= dead] = over
+        games += deltas[chosen]
+        games &= kept_bits[chosen]
+        # A wound is fatal unless the doctor is friendly and healed at most 2 of them. Without
+        # him the subtraction wraps around, past any number of injuries.
+        fatal = injuring[chosen] & ((games & injury_bits) - doctor_friendly > max_healed)
+        games |= fatal.astype(numpy.uint64) << dead_shift
+    return numpy.unique(games, return_counts=True)
+
+
+@dataclass
+class SimulationResult:
+    games: int
+    seed: int
+    backend: str
+    # Scores with their last 2 digits at 0, the game makes them random
+    score_histogram: dict[int, int]
+    metric_histograms: dict[str, dict[int, int]]
+    deaths: int
+
+    def mean_score(self) -> float:
+        return sum(score * count for score, count in self.score_histogram.items()) / self.games
+
+    def mean_metrics(self) -> dict[str, float]:
+        return {name: sum(v * c for v, c in histogram.items()) / self.games
+                for name, histogram in self.metric_histograms.items()}
+
+    def to_dict(self) -> dict:
+        return {"games": self.games, "seed": self.seed, "backend": self.backend, "deaths": self.deaths,
+                "mean_score": self.mean_score(), "score_histogram": self.score_histogram,
+                "mean_metrics": self.mean_metrics(), "metric_histograms": self.metric_histograms}
+
+
+def compare_histograms(first: dict[int, int], second: dict[int, int]) -> tuple[float, int]:
+    """Two-sample chi-squared statistic of histograms over the same number of games, and its
+    degrees of freedom."""
+    bins = []
+    pooled = [0, 0]
+    for value in sorted(set(first) | set(second)):
+        a, b = first.get(value, 0), second.get(value, 0)
+        if a + b < MIN_BIN_GAMES:
+            pooled[0] += a
+            pooled[1] += b
+        else:
+            bins.append((a, b))
+    if sum(pooled):
+        bins.append(tuple(pooled))
+    return sum((a - b) ** 2 / (a + b) for a, b in bins), len(bins) - 1
+
+
+def get_chi_squared_bound(degrees: int) -> float:
+    # Wilson-Hilferty approximation of the chi-squared quantile at COMPARISON_Z
+    if degrees < 1:
+        return 0.0
+    h = 2 / (9 * degrees)
+    return degrees * (1 - h + COMPARISON_Z * h ** 0.5) ** 3
+
+
+@dataclass
+class BackendComparison:
+    python: SimulationResult
+    numpy: SimulationResult
+    statistic: float
+    degrees: int
+    bound: float
+
+    def agree(self) -> bool:
+        return self.statistic <= self.bound
+
+    def to_dict(self) -> dict:
+        return {"agree": self.agree(), "statistic": self.statistic, "degrees": self.degrees, "bound": self.bound,
+                "python": self.python.to_dict(), "numpy": self.numpy.to_dict()}
+
+
+class ScoreSimulator:
+    """Monte Carlo games over the outcome tables of the scenes, played in scene order."""
+
+    def __init__(self, analytics: OutcomeAnalytics, model: PlayerModel = None):
+        self.analytics = analytics
+        self.model = model or PlayerModel()
+        self.scenes = [SceneDistribution.from_analytics(analytics, n, self.model) for n in analytics.scene_numbers]
+
+    def run(self, games=DEFAULT_GAMES, seed=0, batch_size=DEFAULT_BATCH_SIZE, use_numpy=None) -> SimulationResult:
+        """Play games in batches. The same seed gives the same result with the same backend:
+        random.Random for the pure Python one, NumPy's default_rng for the other."""
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise Exception("NumPy is not installed")
+        if use_numpy:
+            return self.run_numpy(games, seed, batch_size)
+        rng = random.Random(seed)
+        final_games = Counter()
+        for start in range(0, games, batch_size):
+            final_games.update(play_batch_python(self.scenes, min(batch_size, games - start), rng))
+        return self.summarize(final_games, games, seed, "python")
+
+    def run_numpy(self, games, seed, batch_size) -> SimulationResult:
+        rng = numpy.random.default_rng(seed)
+        values = numpy.zeros(0, numpy.uint64)
+        counts = numpy.zeros(0, numpy.int64)
+        pending = []
+        for start in range(0, games, batch_size):
+            pending.append(play_batch_numpy(self.scenes, min(batch_size, games - start), rng))
+            # Merged once the batches outgrow what is merged already, so each game is sorted
+            # a few times only
+            if start + batch_size >= games or sum(len(v) for v, c in pending) > max(len(values), batch_size):
+                values, positions = numpy.unique(numpy.concatenate([values] + [v for v, c in pending]),
+                                                 return_inverse=True)
+                counts = numpy.bincount(positions.ravel(), numpy.concatenate([counts] + [c for v, c in pending]),
+                                        len(values)).astype(numpy.int64)
+                pending = []
+        return self.summarize_numpy(values, counts, games, seed)
+
+    def compare_backends(self, games=DEFAULT_GAMES, seed=0, batch_size=DEFAULT_BATCH_SIZE) -> BackendComparison:
+        """Play the same number of games with both backends and test that their score
+        distributions are the same. The random streams differ, so only statistically."""
+        python_result = self.run(games, seed, batch_size, use_numpy=False)
+        numpy_result = self.run(games, seed, batch_size, use_numpy=True)
+        statistic, degrees = compare_histograms(python_result.score_histogram, numpy_result.score_histogram)
+        return BackendComparison(python_result, numpy_result, statistic, degrees, get_chi_squared_bound(degrees))
+
+    def summarize(self, final_games: Counter, games, seed, backend) -> SimulationResult:
+        scores = Counter()
+        metric_histograms = [Counter() for name in METRIC_NAMES]
+        deaths = 0
+        for game, count in final_games.items():
+            metrics = get_game_metrics(game)
+            scores[compute_score(metrics)] += count
+            for histogram, value in zip(metric_histograms, get_final_metrics(metrics)):
+                histogram[value] += count
+            if game & DEAD:
+                deaths += count
+        return SimulationResult(games, seed, backend, dict(sorted(scores.items())),
+                                {name: dict(sorted(histogram.items()))
+                                 for name, histogram in zip(METRIC_NAMES, metric_histograms)},
+                                deaths)
+
+    @staticmethod
+    def summarize_numpy(values, counts, games, seed) -> SimulationResult:
+        # Every final metric only depends on its own field: look the fields up in tables of
+        # what get_final_metrics makes of them. The running total is then computed once per
+        # distinct set of final metrics, far fewer than the distinct games, and the score once
+        # per running total.
+        final_metrics = []
+        for metric in range(len(METRIC_NAMES)):
+            table = numpy.array([get_final_metrics(get_game_metrics(get_metric_delta(metric, value)))[metric]
+                                 for value in range(1 << METRIC_BITS)], numpy.int64)
+            final_metrics.append(table[(values >> numpy.uint64(METRIC_BITS * metric)) & numpy.uint64(0xFF)])
+        distinct, positions = numpy.unique(numpy.stack(final_metrics, axis=1), axis=0, return_inverse=True)
+        totals = [get_running_total(row) for row in distinct.tolist()]
+        scores_by_total = {total: get_score_for_total(total) for total in set(totals)}
+        distinct_scores = numpy.array([scores_by_total[total] for total in totals], numpy.int64)
+
+        def get_histogram(keys) -> dict[int, int]:
+            histogram = numpy.bincount(keys, counts)
+            return {value: int(histogram[value]) for value in numpy.flatnonzero(histogram).tolist()}
+
+        scores = get_histogram(distinct_scores[positions.ravel()])
+        metric_histograms = {name: get_histogram(metric_values)
+                             for name, metric_values in zip(METRIC_NAMES, final_metrics)}
+        deaths = int(counts[values >= numpy.uint64(DEAD)].sum())
+        return SimulationResult(games, seed, "numpy", scores, metric_histograms, deaths)
+
+
+def format_result(result: SimulationResult) -> str:
+    lines = [f"{result.games} games, seed {result.seed}, {result.backend} backend",
+             f"Sheriff dead before the end: {result.deaths} ({result.deaths / result.games:.1%})",
+             f"Mean score: {result.mean_score():.0f} (last 2 digits random in the game, 00 here)",
+             "Score histogram"]
+    top = max(result.score_histogram.values())
+    for score, count in result.score_histogram.items():
+        lines.append(f"  {score:04d} {count / result.games:>7.2%} " + "#" * round(40 * count / top))
+    lines.append("Final metrics as game_over shows them (mean, value: share)")
+    for name, mean in result.mean_metrics().items():
+        shares = ", ".join(f"{v}: {c / result.games:.1%}" for v, c in result.metric_histograms[name].items())
+        lines.append(f"  {name:<17}{mean:>6.2f}  {shares}")
+    return "\n".join(lines) + "\n"
+
+
+def format_comparison(comparison: BackendComparison) -> str:
+    lines = [f"{comparison.python.games} games per backend, seed {comparison.python.seed}",
+             f"Mean score: python {comparison.python.mean_score():.0f}, numpy {comparison.numpy.mean_score():.0f}",
+             f"Deaths: python {comparison.python.deaths}, numpy {comparison.numpy.deaths}",
+             f"Chi-squared {comparison.statistic:.1f} with {comparison.degrees} degrees of freedom, "
+             f"bound {comparison.bound:.1f}: " + ("same distribution" if comparison.agree() else "DIFFERENT")]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate random playthroughs and their final scores")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="number of games, %(default)s by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--backend", choices=("auto", "python", "numpy"), default="auto",
+                        help="numpy if installed by default")
+    parser.add_argument("--index", help="read the outcomes from a dialogue index saved by law-west-decoder --index "
+                                        "instead of decoding side1.g64 and side2.g64")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--compare-backends", action="store_true",
+                        help="play the games with both backends and check that their score distributions match, "
+                             "exits with 1 if they don't")
+    args = parser.parse_args()
+    if args.games < 1 or args.batch_size < 1:
+        parser.error("--games and --batch-size must be at least 1")
+    if args.compare_backends and numpy is None:
+        parser.error("--compare-backends needs NumPy")
+
+    if args.index:
+        from dialogue_index import DialogueIndex
+        analytics = OutcomeAnalytics.from_index(DialogueIndex.load(args.index))
+    else:
+        from disk_reader import SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, read_scenes_for_sides
+        from g64 import G64
+        from scene_location import SCENE_LOCATIONS
+        with G64("side1.g64", use_mmap=True) as side_1, G64("side2.g64", use_mmap=True) as side_2:
+            analytics = OutcomeAnalytics.from_scenes_data(read_scenes_for_sides(
+                SCENE_LOCATIONS, [(side_1, SIDE1_EXCLUDED_TRACKS), (side_2, SIDE2_EXCLUDED_TRACKS)]))
+    if args.compare_backends:
+        backend_comparison = ScoreSimulator(analytics).compare_backends(args.games, args.seed, args.batch_size)
+        if args.json:
+            print(json.dumps(backend_comparison.to_dict(), indent=1))
+        else:
+            print(format_comparison(backend_comparison), end="")
+        sys.exit(0 if backend_comparison.agree() else 1)
+    backend = {"auto": None, "python": False, "numpy": True}[args.backend]
+    simulation = ScoreSimulator(analytics).run(args.games, args.seed, args.batch_size, backend)
+    if args.json:
+        print(json.dumps(simulation.to_dict(), indent=1))
+    else:
+        print(format_result(simulation), end="")
@@ -0,0 +1,112 @@
+import os
+import random
+
+from disk_entities import TrackId, get_sectors_per_track
+from disk_reader import FIRST_TRACK, LAST_TRACK, SIDE1_EXCLUDED_TRACKS, SIDE1_SCENES, SIDE2_EXCLUDED_TRACKS
+from g64_writer import G64Writer
+from gcr_encoder import GCREncoder
+from rapidlok_track_reader import RapidlokTrackReader
+from rapidlok_track_writer import SECTOR_PAYLOAD_SIZE, encode_track
+from scene_location import SCENE_LOCATIONS
+
+# Deterministic stand-ins for the original disks, so the decoders can be exercised and
+# timed without the copyrighted images. Layouts follow what the readers expect, the
+# contents are pseudo-random from the seed.
+
+DOS_SYNC = b"\xff" * 5
+DOS_HEADER_GAP = b"\x55" * 9
+DOS_SECTOR_GAP = b"\x55" * 8
+DOS_DISK_ID = (0x41, 0x42)
+
+SCENE_LOAD_ADDRESS = b"\x7f\x9f"
+SCENE_OUTCOMES = 64
+SCENE_TEXT_OFFSET = 0x140
+SCENE_TEXT_SIZE = 169 * 25
+# NPC states found in the outcome tables of the original scenes
+NPC_STATES = (1, 2, 3, 4, 5, 6, 7, 8, 9, 15, 18, 19, 21)
+
+
+def random_bytes(rng: random.Random, length: int) -> bytes:
+    return rng.getrandbits(length * 8).to_bytes(length, "little") if length else b""
+
+
+def build_dos_track(track_number: int, rng: random.Random):
+    """A 1541 DOS track with random sector contents. Returns the track bytes and {sector: 256 bytes}."""
+    id_2, id_1 = DOS_DISK_ID[1], DOS_DISK_ID[0]
+    parts = []
+    payloads = {}
+    for sector in range(get_sectors_per_track(track_number) + 1):
+        payload = random_bytes(rng, 256)
+        payloads[sector] = payload
+        checksum = 0
+        for b in payload:
+            checksum ^= b
+        header = bytes([0x08, sector ^ track_number ^ id_2 ^ id_1, sector, track_number, id_2, id_1, 0x0F, 0x0F])
+        parts += [DOS_SYNC, GCREncoder.encode_gcr_bytes(header), DOS_HEADER_GAP, DOS_SYNC,
+                  GCREncoder.encode_gcr_bytes(bytes([0x07]) + payload + bytes([checksum, 0, 0])), DOS_SECTOR_GAP]
+    return b"".join(parts), payloads
+
+
+def build_scene_data(rng: random.Random) -> bytes:
+    # Load address, outcome table, then the packed text area of the dialogue lines
+    outcomes = bytes((rng.randrange(8) << 5) | rng.choice(NPC_STATES) for _ in range(SCENE_OUTCOMES))
+    filler = random_bytes(rng, SCENE_TEXT_OFFSET - SCENE_OUTCOMES)
+    return SCENE_LOAD_ADDRESS + outcomes + filler + random_bytes(rng, SCENE_TEXT_SIZE)
+
+
+def place_scene(side_sectors, loc, scene_data: bytes):
+    # Walk the sectors exactly like disk_reader.read_scenes does
+    track, sector = loc.start_track, loc.start_sector
+    pos = 0
+    while True:
+        chunk = scene_data[pos:pos + SECTOR_PAYLOAD_SIZE]
+        pos += SECTOR_PAYLOAD_SIZE
+        if chunk:
+            side_sectors[(track, sector)] = chunk + side_sectors[(track, sector)][len(chunk):]
+        if track == loc.end_track and sector == loc.end_sector:
+            break
+        if sector == RapidlokTrackReader.compute_total_sectors(track):
+            track += 1
+            sector = 0
+        else:
+            sector += 1
+        if track == LAST_TRACK + 1:
+            track = FIRST_TRACK
+
+
+def build_game_images(seed=0) -> tuple[bytes, bytes]:
+    """Both sides of a synthetic game disk: Rapidlok tracks holding a scene at every
+    SCENE_LOCATIONS entry, and DOS tracks where the original has them."""
+    rng = random.Random(seed)
+    sides = []
+    for side_number, excluded_tracks in ((1, SIDE1_EXCLUDED_TRACKS), (2, SIDE2_EXCLUDED_TRACKS)):
+        side_sectors = {}
+        for track in range(FIRST_TRACK, LAST_TRACK + 1):
+            if track not in excluded_tracks:
+                for sector in range(RapidlokTrackReader.compute_total_sectors(track) + 1):
+                    side_sectors[(track, sector)] = random_bytes(rng, SECTOR_PAYLOAD_SIZE)
+        for scene_id, loc in SCENE_LOCATIONS.items():
+            if (scene_id in SIDE1_SCENES) == (side_number == 1):
+                place_scene(side_sectors, loc, build_scene_data(rng))
+
+        writer = G64Writer()
+        for track in range(FIRST_TRACK, LAST_TRACK + 1):
+            if track in excluded_tracks:
+                track_bytes = build_dos_track(track, rng)[0]
+            else:
+                track_bytes = encode_track(track, {sector: side_sectors[(track, sector)]
+                                                   for sector in range(RapidlokTrackReader.compute_total_sectors(track) + 1)})
+            writer.set_track(TrackId(f"{track}.0"), track_bytes)
+        sides.append(writer.to_bytes())
+    return sides[0], sides[1]
+
+
+def write_game_images(directory, seed=0) -> tuple[str, str]:
+    """Write side1.g64 and side2.g64 to directory, returns their paths."""
+    paths = []
+    for name, image in zip(("side1.g64", "side2.g64"), build_game_images(seed)):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as file:
+            file.write(image)
+        paths.append(path)
+    return paths[0], paths[1]
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top-level modules from dump-dialogue
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_images import write_game_images  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def game_images(tmp_path_factory):
+    """Paths of a synthetic side1.g64 and side2.g64, with a scene at every scene location."""
+    return write_game_images(str(tmp_path_factory.mktemp("game")), seed=3)
+
+
+@pytest.fixture(scope="session")
+def game_scenes(game_images):
+    """Data of every scene of the synthetic images, by scene id."""
+    from disk_reader import SIDE1_EXCLUDED_TRACKS, SIDE2_EXCLUDED_TRACKS, read_scenes_for_sides
+    from g64 import G64
+    from scene_location import SCENE_LOCATIONS
+    with G64(game_images[0]) as side_1, G64(game_images[1]) as side_2:
+        return read_scenes_for_sides(SCENE_LOCATIONS, [(side_1, SIDE1_EXCLUDED_TRACKS), (side_2, SIDE2_EXCLUDED_TRACKS)])
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from decode_cache import ENTRY_CHECKSUM_SIZE, DecodeCache
+from disk_entities import Track
+
+FINGERPRINT = "0123456789abcdef0123456789abcdef"
+
+
+def get_sectors(track: Track) -> dict[int, bytes]:
+    return {sector_number: bytes(track.get_payload(sector_number)) for sector_number in track}
+
+
+@pytest.fixture
+def track():
+    return Track.from_sectors(5, {0: b"\x9f\x7f" + bytes(range(200)), 2: b"abc" * 128, 10: b""})
+
+
+def test_sectors_round_trip(track):
+    packed = DecodeCache.pack_sectors(track)
+    assert get_sectors(DecodeCache.unpack_sectors(5, packed)) == get_sectors(track)
+
+
+def test_scenes_round_trip():
+    scenes_data = {"1": bytearray(b"scene one"), "10": bytearray(), "4a": bytearray(range(256)) * 3}
+    assert DecodeCache.unpack_scenes(DecodeCache.pack_scenes(scenes_data)) == scenes_data
+
+
+def test_truncated_entries_do_not_unpack(track):
+    packed = DecodeCache.pack_sectors(track)
+    packed_scenes = DecodeCache.pack_scenes({"1": b"scene one", "2": b"scene two"})
+    for length in (5, 9, len(packed) - 1):
+        assert DecodeCache.unpack_sectors(5, packed[:length]) is None
+    for length in (5, 8, len(packed_scenes) - 1):
+        assert DecodeCache.unpack_scenes(packed_scenes[:length]) is None
+
+
+def test_get_and_put(tmp_path, track):
+    cache = DecodeCache(str(tmp_path))
+    assert cache.get_track(FINGERPRINT, 5) is None
+    cache.put_track(FINGERPRINT, 5, track)
+    assert get_sectors(cache.get_track(FINGERPRINT, 5)) == get_sectors(track)
+    # A new cache over the same directory sees the entry too
+    assert get_sectors(DecodeCache(str(tmp_path)).get_track(FINGERPRINT, 5)) == get_sectors(track)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_corrupt_entry_is_a_miss_and_deleted(tmp_path, track):
+    cache = DecodeCache(str(tmp_path))
+    cache.put_track(FINGERPRINT, 5, track)
+    path = os.path.join(tmp_path, cache.track_entry_name(FINGERPRINT, 5))
+    with open(path, "r+b") as file:
+        file.seek(20)
+        byte = file.read(1)
+        file.seek(20)
+        file.write(bytes([byte[0] ^ 1]))
+    assert cache.get_track(FINGERPRINT, 5) is None
+    assert not os.path.exists(path)
+    assert cache.total_size == 0
+
+
+def test_truncated_entry_is_a_miss(tmp_path, track):
+    cache = DecodeCache(str(tmp_path))
+    cache.put_track(FINGERPRINT, 5, track)
+    path = os.path.join(tmp_path, cache.track_entry_name(FINGERPRINT, 5))
+    os.truncate(path, 3)
+    assert cache.get_track(FINGERPRINT, 5) is None
+    assert not os.path.exists(path)
+
+
+def test_entry_vanishing_while_read_is_a_miss(tmp_path, track, monkeypatch):
+    cache = DecodeCache(str(tmp_path))
+    cache.put_track(FINGERPRINT, 5, track)
+
+    def evicted_meanwhile(path):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted_meanwhile)
+    assert cache.get_track(FINGERPRINT, 5) is None
+    assert cache.total_size == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, track):
+    entry_size = len(DecodeCache.pack_sectors(track)) + ENTRY_CHECKSUM_SIZE
+    cache = DecodeCache(str(tmp_path), max_bytes=entry_size * 3)
+    for track_num in range(1, 4):
+        cache.put_track(FINGERPRINT, track_num, track)
+        path = os.path.join(tmp_path, cache.track_entry_name(FINGERPRINT, track_num))
+        os.utime(path, (track_num, track_num))
+    # Reading track 1 makes it the most recently used, so track 2 goes first
+    assert cache.get_track(FINGERPRINT, 1) is not None
+    cache.put_track(FINGERPRINT, 4, track)
+    assert cache.total_size <= cache.max_bytes
+    assert [n for n in range(1, 5) if cache.get_track(FINGERPRINT, n) is not None] == [1, 3, 4]
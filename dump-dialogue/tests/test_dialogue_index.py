@@ -0,0 +1,81 @@
+import pytest
+
+from dialogue import TEXT_AREA_OFFSET, TOTAL_LINES, get_outcome_offset
+from dialogue_index import PATH_LINE_IDS, DialogueIndex, SceneIndex, get_selections_for_path
+from text_decoder import decode_text_area
+
+ALL_SELECTIONS = [get_selections_for_path(i) for i in range(64)]
+
+
+@pytest.fixture(scope="module")
+def index(game_scenes):
+    return DialogueIndex.from_scenes_data(game_scenes)
+
+
+def assert_same_index(loaded, index):
+    assert sorted(loaded.scenes) == sorted(index.scenes)
+    for scene_number, scene in index.scenes.items():
+        assert loaded[scene_number].lines == scene.lines
+        assert loaded[scene_number].outcomes == scene.outcomes
+        for selections in ALL_SELECTIONS:
+            assert loaded[scene_number].lookup(selections) == scene.lookup(selections)
+
+
+def test_index_matches_the_scenes(game_scenes, index):
+    assert sorted(index.scenes) == sorted(int(scene_id) for scene_id in game_scenes)
+    for scene_id, scene_data in game_scenes.items():
+        scene = index[int(scene_id)]
+        assert scene.lines == tuple(decode_text_area(scene_data, TEXT_AREA_OFFSET, TOTAL_LINES))
+        for selections in ALL_SELECTIONS:
+            path_lines, outcome = scene.lookup(selections)
+            assert outcome == scene_data[get_outcome_offset(selections)]
+            row = get_outcome_offset(selections) * 7
+            assert path_lines == tuple(scene.lines[i] for i in PATH_LINE_IDS[row:row + 7])
+
+
+def test_bytes_round_trip(index):
+    assert_same_index(DialogueIndex.from_bytes(index.to_bytes()), index)
+
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "dialogue.idx")
+    index.save(path)
+    assert_same_index(DialogueIndex.load(path), index)
+
+
+def test_short_last_line_round_trip():
+    # A scene ending inside its text area has a shorter last line
+    scenes = [SceneIndex(4, ["A" * 40, "B" * 40, "C" * 16], bytes(range(64))),
+              SceneIndex(5, ["D" * 40, "E" * 40], bytes(range(64, 128)))]
+    loaded = DialogueIndex.from_bytes(DialogueIndex(scenes).to_bytes())
+    for scene in scenes:
+        assert loaded[scene.scene_number].lines == scene.lines
+        assert loaded[scene.scene_number].outcomes == scene.outcomes
+
+
+@pytest.mark.parametrize("data", [b"", b"LWDI", b"LWDX\x02\x00", b"LWDI\x01\x00"])
+def test_from_bytes_rejects_other_data(data):
+    with pytest.raises(Exception, match="Not a dialogue index"):
+        DialogueIndex.from_bytes(data)
+
+
+def test_from_bytes_rejects_truncated_data(index):
+    data = index.to_bytes()
+    for size in (6, 7, 100, len(data) - 1):
+        with pytest.raises(Exception, match="truncated"):
+            DialogueIndex.from_bytes(data[:size])
+    with pytest.raises(Exception, match="trailing data"):
+        DialogueIndex.from_bytes(data + b"\0")
+
+
+@pytest.mark.parametrize("selections", [(0, 1, 1), (1, 1, 5), (1, 1), (1, 1, 1, 1)])
+def test_lookup_rejects_invalid_selections(index, selections):
+    with pytest.raises(Exception, match="Invalid selections"):
+        index[4].lookup(selections)
+
+
+def test_paths_with_outcome(index):
+    scene = index[4]
+    for outcome in set(scene.outcomes):
+        paths = scene.paths_with_outcome(outcome)
+        assert paths == [s for s in ALL_SELECTIONS if scene.lookup(s)[1] == outcome]
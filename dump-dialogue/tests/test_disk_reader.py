@@ -0,0 +1,61 @@
+import pytest
+
+from disk_entities import TrackId
+from disk_reader import (SectorNotFoundError, get_scene_sectors, plan_scene_reads, read_scenes,
+                         read_scenes_on_demand)
+from g64 import G64
+from rapidlok_track_reader import RapidlokTrackReader
+from scene_location import SCENE_LOCATIONS, SceneLocation
+
+# Scene 9 runs from track 34 over the end of side 2 to track 2
+WRAPPING_SCENE = "9"
+
+
+def last_sector(track):
+    return RapidlokTrackReader.compute_total_sectors(track)
+
+
+def test_scene_sectors_wrap_to_the_first_track():
+    sectors = get_scene_sectors(SCENE_LOCATIONS[WRAPPING_SCENE])
+    assert sectors[0] == (34, 7)
+    assert sectors[-1] == (2, 6)
+    assert (35, last_sector(35)) in sectors
+    assert sectors[sectors.index((35, last_sector(35))) + 1] == (1, 0)
+    assert all(1 <= track <= 35 for track, sector in sectors)
+    assert len(sectors) == len(set(sectors))
+
+
+def test_plan_wraps_to_the_first_track():
+    plan = plan_scene_reads(SCENE_LOCATIONS, [WRAPPING_SCENE])
+    assert plan == {1: {}, 2: {34: set(range(7, last_sector(34) + 1)),
+                               35: set(range(last_sector(35) + 1)),
+                               1: set(range(last_sector(1) + 1)),
+                               2: set(range(7))}}
+
+
+def test_plan_merges_the_sectors_of_all_scenes():
+    plan = plan_scene_reads(SCENE_LOCATIONS, ["1", "10", WRAPPING_SCENE])
+    assert sorted(plan[1]) == [2, 3, 4]
+    # Scene 10 starts on track 2 right after the sector scene 9 ends on
+    assert plan[2][2] == set(range(last_sector(2) + 1))
+
+
+def test_plan_rejects_excluded_tracks():
+    locations = {"1": SceneLocation(16, 5, 18, 2)}
+    with pytest.raises(Exception, match="track 17, which is not in Rapidlok format"):
+        plan_scene_reads(locations, ["1"])
+
+
+def test_on_demand_matches_full_decode(game_images, game_scenes):
+    scene_ids = ["4", "10", WRAPPING_SCENE]
+    with G64(game_images[0]) as side_1, G64(game_images[1]) as side_2:
+        scenes_data = read_scenes_on_demand(SCENE_LOCATIONS, scene_ids, side_1, side_2)
+    assert scenes_data == {scene_id: game_scenes[scene_id] for scene_id in scene_ids}
+
+
+def test_missing_sector_is_reported(game_images):
+    with G64(game_images[1]) as side_2:
+        tracks = {track: RapidlokTrackReader(track, side_2[TrackId("%d.0" % track)]).get_track() for track in (34, 35, 2)}
+    with pytest.raises(SectorNotFoundError) as raised:
+        read_scenes({WRAPPING_SCENE: SCENE_LOCATIONS[WRAPPING_SCENE]}, {}, tracks)
+    assert (raised.value.side_number, raised.value.track_num, raised.value.sector) == (2, 1, 0)
@@ -0,0 +1,40 @@
+import pytest
+
+from disk_entities import TrackId
+from g64 import G64
+from g64_writer import G64Writer
+from rapidlok_track_reader import RapidlokTrackReader
+from rapidlok_track_writer import SECTOR_PAYLOAD_SIZE, patch_sector
+
+
+@pytest.mark.parametrize("use_mmap", [False, True], ids=["read", "mmap"])
+@pytest.mark.parametrize("mode", [G64.MODE_RAW, G64.MODE_GCR, G64.MODE_RAPIDLOK])
+def test_from_g64_writes_the_image_back(game_images, mode, use_mmap):
+    for path in game_images:
+        with open(path, "rb") as file:
+            image = file.read()
+        with G64(path, use_mmap=use_mmap, mode=mode) as g64:
+            # Decoded tracks in the LRU must not end up in the copy
+            if mode != G64.MODE_RAW:
+                g64[TrackId("18.0" if mode == G64.MODE_GCR else "5.0")]
+            assert G64Writer.from_g64(g64).to_bytes() == image
+
+
+def test_patched_image_reads_back(game_images, tmp_path):
+    track_id = TrackId("5.0")
+    payload = bytes(range(256)) + bytes(SECTOR_PAYLOAD_SIZE - 256)
+    with G64(game_images[0]) as g64:
+        writer = G64Writer.from_g64(g64)
+        track = g64.get_raw_track(track_id)
+        size = int.from_bytes(track[:G64.TRACK_SIZE_HEADER], "little")
+        track_bytes = track[G64.TRACK_SIZE_HEADER:G64.TRACK_SIZE_HEADER + size]
+        writer.set_track(track_id, patch_sector(track_bytes, 5, 7, payload))
+    patched_path = str(tmp_path / "patched.g64")
+    writer.save(patched_path)
+    with G64(patched_path) as patched, G64(game_images[0]) as original:
+        patched_track = RapidlokTrackReader(5, patched[track_id]).get_track()
+        original_track = RapidlokTrackReader(5, original[track_id]).get_track()
+        assert bytes(patched_track.get_payload(7)) == payload
+        for sector in original_track:
+            if sector != 7:
+                assert patched_track.get_payload(sector) == original_track.get_payload(sector)
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from decode_metrics import DecodeMetrics
+from g64_writer import pack_track
+from gcr_decoder import GCR_NIBBLES, GCRDecoder
+from gcr_encoder import GCREncoder
+from gcr_track_reader import GCRTrackReader
+from synthetic_images import build_dos_track
+
+TRACK = 18
+
+
+def encode_gcr_bytes_bitwise(data):
+    # 5-bit codes of every nibble, back to back
+    codes = {nibble: code for code, nibble in GCR_NIBBLES.items()}
+    value = 0
+    for b in data:
+        value = (value << 10) | (codes[b >> 4] << 5) | codes[b & 0x0F]
+    return value.to_bytes(len(data) * 10 // 8, "big")
+
+
+def test_gcr_round_trip():
+    data = bytes(range(256)) + random.Random(0).randbytes(1024)
+    encoded = GCREncoder.encode_gcr_bytes(data)
+    assert encoded == encode_gcr_bytes_bitwise(data)
+    assert GCRDecoder.decode_gcr_buffer(encoded) == (data, 0)
+
+
+def test_gcr_length_must_be_whole_groups():
+    with pytest.raises(Exception):
+        GCREncoder.encode_gcr_bytes(b"abc")
+    with pytest.raises(Exception):
+        GCRDecoder.decode_gcr_buffer(b"abcd")
+
+
+def test_invalid_gcr_codes_are_flagged():
+    encoded = bytearray(GCREncoder.encode_gcr_bytes(b"\x12\x34\x56\x78\x9a\xbc\xde\xf0"))
+    # Zero the first 10 bits of the second group: byte 4 can't be decoded
+    encoded[5] = 0
+    encoded[6] &= 0x3F
+    decoded, errors = GCRDecoder.decode_gcr_buffer(bytes(encoded))
+    assert GCRDecoder.error_positions(errors) == [4]
+    assert decoded[4] == 0xFF and decoded[:4] == b"\x12\x34\x56\x78" and decoded[5:] == b"\xbc\xde\xf0"
+
+
+def read_dos_track(track_bytes):
+    metrics = DecodeMetrics()
+    track = GCRTrackReader(metrics).read_track(TRACK, pack_track(track_bytes))
+    return track, metrics.counters
+
+
+def get_checksum(payload):
+    checksum = 0
+    for b in payload:
+        checksum ^= b
+    return checksum
+
+
+def get_data_block(payload, checksum):
+    return GCREncoder.encode_gcr_bytes(bytes([0x07]) + payload + bytes([checksum, 0, 0]))
+
+
+def test_dos_track_decodes():
+    track_bytes, payloads = build_dos_track(TRACK, random.Random(0))
+    track, counters = read_dos_track(track_bytes)
+    assert {n: bytes(track.get_payload(n)) for n in track} == payloads
+    assert counters["headers_found"] == counters["sectors_decoded"] == len(payloads)
+    assert "sectors_bad_data" not in counters
+
+
+def test_bad_checksum_is_not_counted_as_decoded():
+    track_bytes, payloads = build_dos_track(TRACK, random.Random(0))
+    checksum = get_checksum(payloads[3])
+    block = get_data_block(payloads[3], checksum)
+    assert track_bytes.count(block) == 1
+    track, counters = read_dos_track(track_bytes.replace(block, get_data_block(payloads[3], checksum ^ 0xFF)))
+    assert counters["headers_found"] == len(payloads)
+    assert counters["sectors_decoded"] == len(payloads) - 1
+    assert counters["sectors_bad_data"] == 1
+
+
+def test_invalid_gcr_is_not_counted_as_decoded():
+    track_bytes, payloads = build_dos_track(TRACK, random.Random(0))
+    block = get_data_block(payloads[5], get_checksum(payloads[5]))
+    assert track_bytes.count(block) == 1
+    # 5 zero bits are no GCR code
+    track, counters = read_dos_track(track_bytes.replace(block, block[:40] + bytes(10) + block[50:]))
+    assert counters["sectors_bad_data"] == 1
+    assert counters["gcr_errors"] > 0
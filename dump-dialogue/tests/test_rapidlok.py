@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from g64_writer import pack_track
+from rapidlok_track_reader import (CHECKSUM_SIZE, RapidlokTrackReader, decode_staggered_triples,
+                                   process_unpacked_data)
+from rapidlok_track_writer import SECTOR_PAYLOAD_SIZE, encode_staggered_triples, encode_track, patch_sector
+
+
+def get_payloads(track_number, rng, sectors=None):
+    if sectors is None:
+        sectors = range(RapidlokTrackReader.compute_total_sectors(track_number) + 1)
+    return {sector: rng.randbytes(SECTOR_PAYLOAD_SIZE) for sector in sectors}
+
+
+def read_track(track_number, track_bytes):
+    return RapidlokTrackReader(track_number, pack_track(track_bytes))
+
+
+def get_sectors(track):
+    return {sector: bytes(track.get_payload(sector)) for sector in track}
+
+
+def test_staggered_triples_round_trip():
+    rng = random.Random(0)
+    data = rng.randbytes(SECTOR_PAYLOAD_SIZE + CHECKSUM_SIZE)
+    assert decode_staggered_triples(encode_staggered_triples(data)) == data
+    every_word = bytes(range(256)) * 2
+    assert decode_staggered_triples(encode_staggered_triples(every_word)) == every_word
+
+
+def test_triple_streams_match_staggered_triples():
+    triples = encode_staggered_triples(random.Random(1).randbytes(SECTOR_PAYLOAD_SIZE + CHECKSUM_SIZE))
+    streams = [list(triples[i::3]) for i in range(3)]
+    assert bytes(process_unpacked_data(*streams)) == decode_staggered_triples(triples)
+
+
+def test_odd_payload_is_rejected():
+    with pytest.raises(Exception):
+        encode_staggered_triples(b"abc")
+
+
+@pytest.mark.parametrize("track_number", [1, 18, 19, 35])
+def test_written_track_reads_back(track_number):
+    payloads = get_payloads(track_number, random.Random(track_number))
+    reader = read_track(track_number, encode_track(track_number, payloads))
+    assert get_sectors(reader.get_track()) == payloads
+    assert reader.missing_sectors == [] and reader.duplicate_sectors == {}
+
+
+def test_missing_sector_is_reported():
+    payloads = get_payloads(5, random.Random(2), sectors=[0, 1, 2, 4, 5, 6, 7, 8, 9, 10, 11])
+    reader = read_track(5, encode_track(5, payloads))
+    assert get_sectors(reader.get_track()) == payloads
+    assert reader.missing_sectors == [3]
+
+
+def test_patched_sector_reads_back():
+    rng = random.Random(3)
+    payloads = get_payloads(20, rng)
+    patched = dict(payloads)
+    patched[4] = rng.randbytes(SECTOR_PAYLOAD_SIZE)
+    track_bytes = patch_sector(encode_track(20, payloads), 20, 4, patched[4])
+    assert get_sectors(read_track(20, track_bytes).get_track()) == patched
@@ -0,0 +1,54 @@
+import itertools
+import random
+
+import pytest
+
+import score_optimizer
+from game_score import compute_score
+from outcome_analytics import OutcomeAnalytics
+from score_optimizer import ScoreOptimizer
+from score_simulator import get_game_metrics
+
+
+def random_analytics(seed):
+    # Three scenes keep the brute force at about 10000 games
+    rng = random.Random(seed)
+    return OutcomeAnalytics({scene_number: rng.randbytes(64) for scene_number in rng.sample(range(1, 12), 3)})
+
+
+def brute_force_score(optimizer):
+    return max(compute_score(get_game_metrics(sum(deltas)))
+               for deltas in itertools.product(*optimizer.scene_options.values()))
+
+
+@pytest.fixture(params=["pareto", "exhaustive"])
+def pareto(request, monkeypatch):
+    if request.param == "exhaustive":
+        # No running total is below it, so every distinct option is kept
+        monkeypatch.setattr(score_optimizer, "WRAPPING_TOTAL", -100)
+    return request.param == "pareto"
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_optimizer_matches_brute_force(pareto, seed):
+    optimizer = ScoreOptimizer(random_analytics(seed))
+    game = optimizer.optimize()
+    assert game.pareto == pareto
+    assert game.score == brute_force_score(optimizer)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_choices_reach_the_score(pareto, seed):
+    optimizer = ScoreOptimizer(random_analytics(seed))
+    game = optimizer.optimize()
+    assert [choice.scene for choice in game.choices] == optimizer.analytics.scene_numbers
+    deltas = []
+    for choice in game.choices:
+        options = optimizer.scene_options[choice.scene]
+        # Every way listed for a choice adds the same metrics
+        matching = [delta for delta, ways in options.items() if ways == choice.ways]
+        assert len(matching) == 1
+        deltas.append(matching[0])
+    metrics = get_game_metrics(sum(deltas))
+    assert metrics == game.metrics
+    assert compute_score(metrics) == game.score
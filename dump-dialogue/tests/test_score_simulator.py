@@ -0,0 +1,84 @@
+import random
+from collections import Counter
+
+import pytest
+
+from game_score import TIMES_INJURED
+from outcome_analytics import OutcomeAnalytics
+from scene_location import SCENE_LOCATIONS
+from score_simulator import (DEAD, DOCTOR_FRIENDLY, INJURY, UNLAWFUL_KILL, SceneDistribution, ScoreSimulator,
+                             build_alias_table, get_metric, play_batch_numpy, play_batch_python)
+
+GAMES = 100
+
+
+def get_scripted_scenes(*deltas):
+    # One scene per delta, each always adding it
+    return [SceneDistribution(i, {delta: 1.0}) for i, delta in enumerate(deltas)]
+
+
+def play_python(scenes):
+    return play_batch_python(scenes, GAMES, random.Random(0))
+
+
+def play_numpy(scenes):
+    numpy = pytest.importorskip("numpy")
+    values, counts = play_batch_numpy(scenes, GAMES, numpy.random.default_rng(0))
+    return dict(zip(map(int, values), map(int, counts)))
+
+
+@pytest.fixture(params=[play_python, play_numpy], ids=["python", "numpy"])
+def play(request):
+    return request.param
+
+
+def test_friendly_doctor_heals(play):
+    games = play(get_scripted_scenes(DOCTOR_FRIENDLY, INJURY, INJURY))
+    assert games == {DOCTOR_FRIENDLY + 2 * INJURY: GAMES}
+
+
+def test_third_injury_kills(play):
+    games = play(get_scripted_scenes(DOCTOR_FRIENDLY, INJURY, INJURY, INJURY))
+    assert games == {(DOCTOR_FRIENDLY + 3 * INJURY) | DEAD: GAMES}
+
+
+def test_unlawful_kill_makes_doctor_hostile(play):
+    games = play(get_scripted_scenes(DOCTOR_FRIENDLY, UNLAWFUL_KILL, INJURY))
+    assert games == {UNLAWFUL_KILL + INJURY + DEAD: GAMES}
+
+
+def test_dead_sheriff_plays_no_more_scenes(play):
+    games = play(get_scripted_scenes(INJURY, INJURY, UNLAWFUL_KILL))
+    (game,) = games
+    assert game & DEAD and get_metric(game, TIMES_INJURED) == 1 and not game & UNLAWFUL_KILL
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    rng = random.Random(0)
+    return ScoreSimulator(OutcomeAnalytics({int(scene_id): rng.randbytes(64) for scene_id in SCENE_LOCATIONS}))
+
+
+def test_alias_table_keeps_the_weights():
+    weights = [0.5, 0.05, 0.2, 0.0, 0.25]
+    probabilities, aliases = build_alias_table(weights)
+    picked = [0.0] * len(weights)
+    for column, (probability, alias) in enumerate(zip(probabilities, aliases)):
+        picked[column] += probability / len(weights)
+        picked[alias] += (1 - probability) / len(weights)
+    assert picked == pytest.approx(weights)
+
+
+def test_numpy_summary_matches_python(simulator):
+    numpy = pytest.importorskip("numpy")
+    values, counts = play_batch_numpy(simulator.scenes, 50000, numpy.random.default_rng(0))
+    final_games = Counter(dict(zip(map(int, values), map(int, counts))))
+    assert (simulator.summarize_numpy(values, counts, 50000, 0)
+            == simulator.summarize(final_games, 50000, 0, "numpy"))
+
+
+def test_backends_agree(simulator):
+    pytest.importorskip("numpy")
+    comparison = simulator.compare_backends(200000, seed=1)
+    assert comparison.agree(), (comparison.statistic, comparison.bound)
+    assert comparison.numpy.backend == "numpy"
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import text_decoder
+from text_decoder import (BYTES_PER_LINE, NUMPY_MIN_BYTES, decode_chunks, decode_packed_5bit_area,
+                          decode_packed_5bit_text, decode_text_area, decode_text_areas)
+
+TOTAL_LINES = 6
+START_OFFSET = 3
+
+
+@pytest.fixture(params=["tables", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        # Small inputs go to the translate tables unless the threshold is lowered
+        monkeypatch.setattr(text_decoder, "NUMPY_MIN_BYTES", 0)
+    else:
+        monkeypatch.setattr(text_decoder, "numpy", None)
+    return request.param
+
+
+@pytest.mark.parametrize("size", [0, 1, 4, 5, 6, 24, 25, 26, 1000, 1003])
+def test_area_matches_per_line_decoder(backend, size):
+    data = random.Random(size).randbytes(size)
+    assert decode_packed_5bit_area(data) == decode_packed_5bit_text(data)
+
+
+def group_with_symbol(symbol, position):
+    return (symbol << (35 - position * 5)).to_bytes(5, "big")
+
+
+def test_every_symbol_in_every_position(backend):
+    # Each of the 32 symbols at each of the 8 positions of a group
+    data = b"".join(group_with_symbol(symbol, position) for symbol in range(32) for position in range(8))
+    assert decode_packed_5bit_area(data) == decode_packed_5bit_text(data)
+
+
+def test_text_areas_match_decode_chunks(backend):
+    rng = random.Random(1)
+    area_size = TOTAL_LINES * BYTES_PER_LINE
+    areas = [rng.randbytes(START_OFFSET + area_size + rng.randrange(3)) for _ in range(20)]
+    # Scenes ending inside their text area
+    areas += [rng.randbytes(START_OFFSET + cut) for cut in (0, 1, BYTES_PER_LINE, area_size - 1)]
+    expected = [decode_chunks(area[START_OFFSET:START_OFFSET + area_size]) for area in areas]
+    assert decode_text_areas(areas, START_OFFSET, TOTAL_LINES) == expected
+    assert [decode_text_area(area, START_OFFSET, TOTAL_LINES) for area in areas] == expected
+
+
+def test_large_input_takes_the_numpy_path():
+    pytest.importorskip("numpy")
+    data = random.Random(2).randbytes(NUMPY_MIN_BYTES + 7)
+    assert decode_packed_5bit_area(data) == decode_packed_5bit_text(data)
@@ -0,0 +1,130 @@
+import sys
+from collections.abc import Iterable, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Define the alphabet mapping as a constant
+ALPHABET: str = " ABCDEFGHIJKLMNOPQRSTUVWXYZ!',.?"
+BYTES_PER_LINE: int = 25
+# 5 bytes hold exactly 8 symbols, so a line (5 groups) or a whole text area can be unpacked
+# group by group with the same result as one bit-buffer running over it
+BYTES_PER_GROUP: int = 5
+SYMBOLS_PER_GROUP: int = 8
+SYMBOLS_PER_LINE: int = BYTES_PER_LINE // BYTES_PER_GROUP * SYMBOLS_PER_GROUP
+SYMBOL_BITS: int = 5
+SYMBOL_MASK: int = (1 << SYMBOL_BITS) - 1
+# Below this many bytes the translate tables beat converting to NumPy arrays and back
+NUMPY_MIN_BYTES: int = 16384
+
+
+def decode_packed_5bit_text(data: Iterable[int]) -> str:
+    """Decode a sequence of bytes into text using the 5-bit packing scheme."""
+    bitstream = 0
+    bitlen = 0
+    result: list[str] = []
+    for b in data:
+        # Add byte to bit buffer
+        bitstream = (bitstream << 8) | b
+        bitlen += 8
+        # Extract as many 5-bit symbols as possible
+        while bitlen >= 5:
+            bitlen -= 5
+            symbol = (bitstream >> bitlen) & 0b11111
+            result.append(ALPHABET[symbol])
+    return "".join(result)
+
+
+def decode_chunks(data: Sequence[int], chunk_size: int = BYTES_PER_LINE) -> list[str]:
+    """Decode in fixed input-byte chunks (default BYTES_PER_LINE)."""
+    chunks: list[str] = []
+    for j in range(0, len(data), chunk_size):
+        block = data[j: j + chunk_size]
+        if not block:
+            break
+        chunks.append(decode_packed_5bit_text(block))
+    return chunks
+
+
+def decode_text_area(data: Sequence[int], start_offset: int, total_lines: int) -> list[str]:
+    return decode_text_areas([data], start_offset, total_lines)[0]
+
+
+def build_symbol_tables():
+    # Symbol k of a group is its bits 5k..5k+4 counting from the most significant one, taken from
+    # at most 2 of the 5 bytes: one (byte index, translate table) per byte it takes bits from
+    group_bits = BYTES_PER_GROUP * 8
+    tables = []
+    for symbol in range(SYMBOLS_PER_GROUP):
+        shift = group_bits - SYMBOL_BITS - symbol * SYMBOL_BITS
+        parts = []
+        for byte_index in range(BYTES_PER_GROUP):
+            byte_shift = group_bits - 8 - byte_index * 8
+            table = bytes(((b << byte_shift) >> shift) & SYMBOL_MASK for b in range(256))
+            if any(table):
+                parts.append((byte_index, table))
+        tables.append(tuple(parts))
+    return tuple(tables)
+
+
+SYMBOL_TABLES = build_symbol_tables()
+ALPHABET_TABLE: bytes = bytes(ord(ALPHABET[i & SYMBOL_MASK]) for i in range(256))
+
+
+def unpack_symbol_groups(data: bytes) -> str:
+    """Text of whole 5-byte groups: one translate per byte column and symbol, all groups at once."""
+    count = len(data) // BYTES_PER_GROUP
+    columns = [data[i::BYTES_PER_GROUP] for i in range(BYTES_PER_GROUP)]
+    result = bytearray(count * SYMBOLS_PER_GROUP)
+    for symbol, parts in enumerate(SYMBOL_TABLES):
+        if len(parts) == 1:
+            byte_index, table = parts[0]
+            symbols = columns[byte_index].translate(table)
+        else:
+            # Symbols straddling two bytes: OR the two parts as big ints
+            value = 0
+            for byte_index, table in parts:
+                value |= int.from_bytes(columns[byte_index].translate(table), "big")
+            symbols = value.to_bytes(count, "big")
+        result[symbol::SYMBOLS_PER_GROUP] = symbols.translate(ALPHABET_TABLE)
+    return result.decode("ascii")
+
+
+def unpack_symbol_groups_numpy(data: bytes) -> str:
+    bits = numpy.unpackbits(numpy.frombuffer(data, numpy.uint8)).reshape(-1, SYMBOL_BITS)
+    symbols = numpy.packbits(bits, axis=1).ravel() >> (8 - SYMBOL_BITS)
+    return numpy.frombuffer(ALPHABET_TABLE, numpy.uint8)[symbols].tobytes().decode("ascii")
+
+
+def decode_packed_5bit_area(data: Iterable[int]) -> str:
+    """Same text as decode_packed_5bit_text, for any amount of data in one pass."""
+    data = bytes(data)
+    whole = len(data) - len(data) % BYTES_PER_GROUP
+    if numpy is not None and whole >= NUMPY_MIN_BYTES:
+        text = unpack_symbol_groups_numpy(data[:whole])
+    else:
+        text = unpack_symbol_groups(data[:whole])
+    # The bit-buffer is empty at every group boundary, so the tail decodes on its own
+    return text + decode_packed_5bit_text(data[whole:])
+
+
+def decode_text_areas(areas: Iterable[Sequence[int]], start_offset: int, total_lines: int) -> list[list[str]]:
+    """decode_text_area of several scenes, the complete areas of all of them unpacked together.
+    Identical lines are interned, so they are one string wherever they appear."""
+    total_size = total_lines * BYTES_PER_LINE
+    slices = [bytes(data[start_offset:start_offset + total_size]) for data in areas]
+    text = decode_packed_5bit_area(b"".join(sliced for sliced in slices if len(sliced) == total_size))
+    area_symbols = total_lines * SYMBOLS_PER_LINE
+    all_lines = []
+    pos = 0
+    for sliced in slices:
+        if len(sliced) == total_size:
+            lines = [sys.intern(text[j:j + SYMBOLS_PER_LINE]) for j in range(pos, pos + area_symbols, SYMBOLS_PER_LINE)]
+            pos += area_symbols
+        else:
+            # Area cut short by the end of the scene: its last line is shorter
+            lines = [sys.intern(line) for line in decode_chunks(sliced, BYTES_PER_LINE)]
+        all_lines.append(lines)
+    return all_lines
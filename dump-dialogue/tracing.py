@@ -0,0 +1,98 @@
+import os
+
+# Tracing for the step by step helpers (bit rotations, decryptor loops...), enabled per module.
+# Messages are %-formatted only once their level is known to be on, so a disabled trace costs
+# one attribute check. Set LOTW_TRACE to turn modules on without editing code, e.g.
+#   LOTW_TRACE=bit_rotation            everything bit_rotation traces
+#   LOTW_TRACE=bit_rotation=debug,*=info
+# where * is the level of every module not listed.
+
+TRACE = 5
+DEBUG = 10
+INFO = 20
+OFF = 100
+LEVELS = {"trace": TRACE, "debug": DEBUG, "info": INFO, "off": OFF}
+ENVIRONMENT_VARIABLE = "LOTW_TRACE"
+ALL_MODULES = "*"
+
+_tracers: dict[str, "Tracer"] = {}
+_module_levels: dict[str, int] = {}
+
+
+class Lazy:
+    """An argument computed only if the message is printed: Lazy(hex_str_8, value)."""
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+
+class Tracer:
+    __slots__ = ("name", "level", "enabled")
+
+    def __init__(self, name, level=OFF):
+        self.name = name
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        # Checked by hot loops before doing any tracing work at all
+        self.enabled = level < OFF
+
+    def is_enabled_for(self, level) -> bool:
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        if level >= self.level:
+            self.write(message % args if args else message)
+
+    def trace(self, message, *args):
+        if TRACE >= self.level:
+            self.write(message % args if args else message)
+
+    def debug(self, message, *args):
+        if DEBUG >= self.level:
+            self.write(message % args if args else message)
+
+    def info(self, message, *args):
+        if INFO >= self.level:
+            self.write(message % args if args else message)
+
+    def write(self, text):
+        print(text)
+
+
+def get_tracer(name) -> Tracer:
+    tracer = _tracers.get(name)
+    if tracer is None:
+        tracer = Tracer(name, _module_levels.get(name, _module_levels.get(ALL_MODULES, OFF)))
+        _tracers[name] = tracer
+    return tracer
+
+
+def set_trace_level(name, level):
+    """Set the level of one module, or of every module not set on its own with name "*"."""
+    if isinstance(level, str):
+        level = LEVELS[level.lower()]
+    _module_levels[name] = level
+    for tracer_name, tracer in _tracers.items():
+        if tracer_name == name or (name == ALL_MODULES and tracer_name not in _module_levels):
+            tracer.set_level(level)
+
+
+def configure_tracing(spec: str):
+    """Apply a LOTW_TRACE style spec: comma separated module[=level], level defaulting to trace."""
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level = item.partition("=")
+        set_trace_level(name.strip(), level.strip() or "trace")
+
+
+configure_tracing(os.environ.get(ENVIRONMENT_VARIABLE, ""))